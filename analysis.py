@@ -1,128 +1,91 @@
-import os 
+import argparse
+import os
 import numpy as np
+from evaluation.metrics import CLASS_NAMES, DIRECTIONS, evaluate
+
+def parse_args() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='accuracy, confusion matrices, precision, recall and F1 of test results, optionally per clip and over probability thresholds.')
+    parser.add_argument('paths', type=str, nargs='+', help='result directories (NPZ parts), NPZ parts or legacy text result files')
+    parser.add_argument('--per_clip', action='store_true', default=False, help='print the accuracy and F1 of every clip')
+    parser.add_argument('--sweep', action='store_true', default=False, help='print precision, recall and F1 over probability thresholds')
+    parser.add_argument('--chunk_size', type=int, default=1000000, help='samples read at a time')
+    args = parser.parse_args()
+    return args
+
+def precision_recall_f1(predict, target, positive):
+    """
+    Precision, recall and F1 of class positive from arrays of predicted and target class indices.
+    """
+    predict = np.asarray(predict)
+    target = np.asarray(target)
+    tp = np.sum((predict == positive) & (target == positive))
+    tp_fp = np.sum(predict == positive)
+    tp_fn = np.sum(target == positive)
+    precision = tp / tp_fp if tp_fp else 0.0
+    recall = tp / tp_fn if tp_fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return float(precision), float(recall), float(f1)
+
+def direction_precision_recall_f1(st_predict, st_target, lf_predict, lf_target):
+    """
+    Pass (class 0, green) and stop (class 1, red) precision, recall and F1 of both directions.
+    """
+    metrics = {}
+    for direction, predict, target in zip(DIRECTIONS, [st_predict, lf_predict], [st_target, lf_target]):
+        for positive, name in enumerate(CLASS_NAMES):
+            metrics[f'{direction} {name}'] = precision_recall_f1(predict, target, positive)
+    return metrics
+
+def print_precision_recall_f1(metrics):
+    for name, (precision, recall, f1) in metrics.items():
+        print(f"{name} precision:{precision*100:.2f}%, recall:{recall*100:.2f}%, F1 score:{f1*100:.2f}%")
+
+def print_accuracy(metrics):
+    for direction in DIRECTIONS:
+        print(f"{direction} accuracy:{metrics[f'{direction} accuracy']*100:.2f}%")
+    print(f"Overall accuracy:{metrics['accuracy']*100:.2f}%")
+
+def print_confusion_matrices(confusion):
+    for direction, matrix in confusion.items():
+        print(f"{direction} confusion (rows target, columns predict {'/'.join(CLASS_NAMES)}):")
+        for name, row in zip(CLASS_NAMES, matrix):
+            print(f"  {name:<5} " + ' '.join(f'{count:>10d}' for count in row))
+
+def print_per_clip(clips):
+    columns = [f'{direction} accuracy' for direction in DIRECTIONS]
+    print(f"{'clip':<40} {'samples':>8} " + ' '.join(f'{column:>20}' for column in columns))
+    for clip, metrics in clips.items():
+        print(f"{os.path.basename(clip.rstrip('/')) or clip:<40} {metrics['samples']:>8d} " + ' '.join(f'{metrics[column]*100:>19.2f}%' for column in columns))
+
+def print_threshold_sweep(thresholds, sweep, step=0.1):
+    shown = np.isclose(thresholds / step, np.round(thresholds / step))
+    for name, (precision, recall, f1) in sweep.items():
+        best = int(np.argmax(f1))
+        print(f"{name}: best F1 {f1[best]*100:.2f}% at threshold {thresholds[best]:.3f}")
+        for i in np.flatnonzero(shown)[1:]:
+            print(f"  >= {thresholds[i]:.2f} precision:{precision[i]*100:.2f}%, recall:{recall[i]*100:.2f}%, F1 score:{f1[i]*100:.2f}%")
 
 def seperate_precision_recall_f1_analysis(txt_path):
-    st_green_tp = 0
-    st_grean_tp_fp = 0
-    st_green_tp_fn = 0
-    st_red_tp = 0
-    st_red_tp_fp = 0
-    st_red_tp_fn = 0
-    st_green_precision = 0
-    st_green_recall = 0
-    st_green_f1 = 0
-    st_red_precision = 0
-    st_red_recall = 0
-    st_red_f1 = 0
-
-    lf_green_tp = 0
-    lf_grean_tp_fp = 0
-    lf_green_tp_fn = 0
-    lf_red_tp = 0
-    lf_red_tp_fp = 0
-    lf_red_tp_fn = 0
-    lf_green_precision = 0
-    lf_green_recall = 0
-    lf_green_f1 = 0
-    lf_red_precision = 0
-    lf_red_recall = 0
-    lf_red_f1 = 0
-
-    with open(txt_path,'r') as f:
-        lines = f.readlines()
-        for line in lines:
-            line = line.strip()
-            info = line.split(' ')
-            # import pdb;pdb.set_trace()
-            # process straight tp+fp
-            if int(info[-5]) == 1:
-                st_grean_tp_fp += 1
-                if info[-5] == info[-4]:
-                    st_green_tp += 1
-            else:
-                st_red_tp_fp += 1
-                if info[-5] == info[-4]:
-                    st_red_tp += 1
-            # process left turn tp+fp
-            if int(info[-3]) == 1:
-                lf_grean_tp_fp += 1
-                if info[-3] == info[-2]:
-                    lf_green_tp += 1
-            else:
-                lf_red_tp_fp += 1
-                if info[-3] == info[-2]:
-                    lf_red_tp += 1
-            # process straight tp+fn
-            if int(info[-4]) == 1:
-                st_green_tp_fn += 1
-            else:
-                st_red_tp_fn += 1
-            # process left turn tp+fn
-            if int(info[-2]) == 1:
-                lf_green_tp_fn += 1
-            else:
-                lf_red_tp_fn += 1
-
-    st_green_precision = st_green_tp / st_grean_tp_fp
-    st_green_recall = st_green_tp / st_green_tp_fn
-    st_green_f1 = 2*st_green_precision * st_green_recall / (st_green_precision + st_green_recall)
-    
-    st_red_precision = st_red_tp / st_red_tp_fp
-    st_red_recall = st_red_tp / st_red_tp_fn
-    st_red_f1 = 2 * st_red_precision * st_red_recall / (st_red_precision + st_red_recall)
-
-    lf_green_precision = lf_green_tp / lf_grean_tp_fp
-    lf_green_recall = lf_green_tp / lf_green_tp_fn
-    lf_green_f1 = 2* lf_green_precision * lf_green_recall / (lf_green_precision + lf_green_recall)
-
-    lf_red_precision = lf_red_tp / lf_red_tp_fp
-    lf_red_recall = lf_red_tp / lf_red_tp_fn
-    lf_red_f1 = 2 * lf_red_precision * lf_red_recall / (lf_red_precision + lf_red_recall)
-
-    print(f"Go Straight Pass precision:{st_green_precision*100:.2f}%, recall:{st_green_recall*100:.2f}%, F1 score:{st_green_f1*100:.2f}%")
-    print(f"Go Straight Stop precision:{st_red_precision*100:.2f}%, recall:{st_red_recall*100:.2f}%, F1 score:{st_red_f1*100:.2f}%")
-    print(f"Left Turn Pass precision:{lf_green_precision*100:.2f}%, recall:{lf_green_recall*100:.2f}%, F1 score:{lf_green_f1*100:.2f}%")
-    print(f"Left Turn Stop precision:{lf_red_precision*100:.2f}%, recall:{lf_red_recall*100:.2f}%, F1 score:{lf_red_f1*100:.2f}%")
+    metrics = evaluate(txt_path).summary()
+    metrics = {key: metrics[key] for key in metrics if key.endswith(CLASS_NAMES)}
+    print_precision_recall_f1(metrics)
+    return metrics
 
 def seperate_analysis(txt_path):
-    data_num = 0
-    st_correct_num = 0
-    lf_correct_num = 0
-    general_correct_num = 0
-    with open(txt_path,'r') as f:
-        lines = f.readlines()
-        for line in lines:
-            line = line.strip()
-            info = line.split(' ')
-            data_num += 1
-            if info[-2] == info[-3]:
-                lf_correct_num += 1
-            if info[-4] == info[-5]:
-                st_correct_num += 1
-            if info[-1] == 'right':
-                general_correct_num += 1
-    # return data_num, correct_num
-    st_acc = st_correct_num/data_num * 100
-    lf_acc = lf_correct_num/data_num * 100
-    gen_acc = general_correct_num/data_num * 100
-    print(f'Go Straight accuracy:{st_acc:.2f}%')
-    print(f'Left Turn accuracy:{lf_acc:.2f}%')
-    print(f'Overall accuracy:{gen_acc:.2f}%')
+    metrics = evaluate(txt_path).summary()
+    print_accuracy(metrics)
+    return metrics
 
 def analysis(txt_path, data_num=0, correct_num=0):
-    data_num = 0
-    correct_num = 0
-    with open(txt_path,'r') as f:
-        lines = f.readlines()
-        for line in lines:
-            line = line.strip()
-            info = line.split(' ')
-            data_num += 1
-            if info[-1] == 'right':
-                correct_num += 1
-    # return data_num, correct_num
-    acc = correct_num/data_num * 100
+    """
+    Add the samples and correct samples (both directions) of a result file to the running counts.
+    """
+    metrics = evaluate(txt_path)
+    data_num += metrics.total
+    correct_num += metrics.both_correct
+    acc = metrics.both_correct/metrics.total * 100 if metrics.total else 0.0
     print(f'accuracy:{acc:.2f}%')
+    return data_num, correct_num
 
 def main(folder_path):
     data_num = 0
@@ -138,15 +101,14 @@ def main(folder_path):
 
 
 if __name__ == '__main__':
-    txt_path = './complete_model_Kaggle_night_n=20_res1.txt'
-    # analysis(txt_path=txt_path)
-    seperate_analysis(txt_path)
-    seperate_precision_recall_f1_analysis(txt_path)
-    # folder_path = '/media/tao/Data_Use/Traffic_Light_Model/prediction_ml_framework/test_res'
-    # main(folder_path)
-
-
-
-
-
-
+    args = parse_args()
+    metrics = evaluate(args.paths, args.chunk_size)
+    summary = metrics.summary()
+    print(f"{summary['samples']} samples")
+    print_accuracy(summary)
+    print_precision_recall_f1({key: summary[key] for key in summary if key.endswith(CLASS_NAMES)})
+    print_confusion_matrices(metrics.confusion_matrices())
+    if args.per_clip:
+        print_per_clip(metrics.per_clip())
+    if args.sweep:
+        print_threshold_sweep(*metrics.threshold_sweep())
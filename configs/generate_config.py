@@ -4,19 +4,42 @@ import os
 def gen_config(out_path):
     config = dict(
         model_name = "LightFormerPredictor",
+        # Frames per window, shorter samples are zero padded and masked by their length
         image_num = 10,
+        # Frame height and width the dataset resizes to
+        image_size = [512, 960],
         embed_dim = 256,
         num_heads = 8,
         num_sam_pts = 8,
         num_levels = 1,
         num_query = 1,
         log_every_n_steps = 10,
+        # Log wall time and memory of every forward pass stage to TensorBoard (profile/...), see models/profiler.py
+        profile = False,
         # [Encoder to Decoder] dimension of MLP layer
         mlp_out_channel = 1024,
         # [Decoder] number of cluster_centres
         n = 8,
         # [Decoder] number of out classes per head
         out_class_num = 2,
+        backbone = dict(
+            # Backbone of models/backbones.py: resnet18, resnet18_w075, resnet18_w050, mobilenet_v3_small, mobilenet_v3_large or efficientnet_b0
+            name = "resnet18",
+            # "imagenet" downloads torchvision's ImageNet weights, a local .pth file works offline, None starts from scratch
+            weights = "imagenet",
+        ),
+        # Neck of models/necks.py between backbone and encoder: conv (original down_conv), depthwise, bottleneck or single
+        neck = "conv",
+        data = dict(
+            # Size of the decoded frame cache shared by dataloader workers, 0 disables it
+            frame_cache_mb = 0,
+            # Frame decoder used by the dataset and tools/preprocess_frames.py: skimage, opencv or torchvision
+            decode_backend = "skimage",
+            # Frame store written by tools/preprocess_frames.py, read instead of decoding images when set
+            frame_store = None,
+            # Frozen backbone features written by tools/build_feature_store.py, read instead of frames when set
+            feature_store = None,
+        ),
         training = dict(
             sample_database_folder = [
                 "/Users/gordonliu/Documents/ml_projects/LightForker/data_label/data/Kaggle_Dataset/dayTrain/dayTrain/dayClip1",
@@ -33,6 +56,16 @@ def gen_config(out_path):
             batch_size = 8,
             loader_worker_num = 8,
             epoch = 10,
+            # Train only the encoder, MLP heads and decoders, required by data.feature_store
+            freeze_backbone = False,
+            # Recompute backbone and neck activations in the backward pass instead of storing them
+            checkpoint_backbone = False,
+            # Frames per backbone and neck pass, 0 for all batch_size x image_num frames at once
+            backbone_chunk_size = 0,
+            # Lightning precision, "bf16-mixed" for bf16 autocast on cpu, the decoders and loss stay in fp32
+            precision = "32-true",
+            # Batches whose gradients are summed before each optimizer step, effective batch size is batch_size x this
+            accumulate_grad_batches = 1,
             accelerator = "mps" # https://lightning.ai/docs/pytorch/stable/accelerators/mps_basic.html
         ),
         validation = dict(
@@ -51,10 +84,16 @@ def gen_config(out_path):
                 "/Users/gordonliu/Documents/ml_projects/LightForker/data_label/data/Kaggle_Dataset/daySequence1/daySequence1",
                 "/Users/gordonliu/Documents/ml_projects/LightForker/data_label/data/Kaggle_Dataset/daySequence2/daySequence2",
             ],
-            batch_size = 1,
+            batch_size = 8,
             loader_worker_num = 8,
             visualization = False,
-            test_result_pkl_dir = "/workspace/debug/prediction_ml_framework/pred_res",
+            # Per sample probabilities and targets are written here as NPZ parts, see evaluation/results.py,
+            # one sub directory per test run. None to disable, eval.py needs it
+            test_result_pkl_dir = None,
+            # SQLite cache of test predictions keyed by the weights and the sample frames, None to disable, see evaluation/cache.py
+            eval_cache = None,
+            # Size of the cached predictions above which the least recently used are evicted
+            eval_cache_mb = 1024,
         ),
         optim = dict(
             init_lr = 0.0001,
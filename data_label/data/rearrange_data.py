@@ -1,92 +1,111 @@
 import os 
 import json
 import random
+import argparse
+import numpy as np
+from multiprocessing import Pool
 from random import shuffle
 
-def gather_info(img_folder):
+# Labels [st_green, st_red, lf_green, lf_red] of the interval names in label interval files
+LABELS = {
+    'st_lf_green': [1, 0, 1, 0],
+    'st_lf_red': [0, 1, 0, 1],
+    'st_g_lf_r': [1, 0, 0, 1],
+    'st_r_lf_g': [0, 1, 1, 0],
+}
 
-    interval = 1
-    # st_green = [[24750, 25044], [25934, 26564], [26884, 27054], [27476, 27644], [27970, 28176], [28468, 28748],  
-    # [29046, 29318], [29604, 29804], [30608, 30754], [31718, 31862], [32890, 33042], [34306, 34422], [35036, 35434], [36084, 36690],[37832, 38022], [38352, 38428], [39194, 39400], [40066, 40344]]
-    # st_red = [[25288, 25930], [28984, 29042], [33048, 33910], [34760, 35030], [35858, 36080], [37068, 37828], [38628, 39190], [39542, 40060]]
-    st_lf_green = [[120,190],[350,468],[667,723],[1311,1453]]
-    st_lf_red = [[520,665]]
-    st_g_lf_r = [[0,119]]
-    st_r_lf_g = []
+def parse_args() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='build sliding window samples.json files from per clip label interval files, many clips in parallel.')
+    parser.add_argument('roots', type=str, nargs='+', help='clip folders, or folders searched for clips: folders with a frames folder and a label interval file')
+    parser.add_argument('--intervals', type=str, default='label_intervals.txt', help='label interval file name inside each clip folder')
+    parser.add_argument('--out', type=str, default='samples.json', help='output file, relative to each clip folder')
+    parser.add_argument('-l', '--length', type=int, default=10, help='frames per window')
+    parser.add_argument('-s', '--stride', type=int, default=None, help='frames between window starts, length x frame_interval (no overlap) if not given')
+    parser.add_argument('-i', '--frame_interval', type=int, default=1, help='frames between consecutive window frames')
+    parser.add_argument('--shuffle', action='store_true', default=False, help='shuffle the windows of each clip')
+    parser.add_argument('-p', '--processes', type=int, default=os.cpu_count(), help='clips processed in parallel')
+    args = parser.parse_args()
+    return args
 
-    all_imgs = sorted(os.listdir(img_folder))
-    final_res_st_lf_green = []
-    final_res_st_lf_red = []
-    final_res_st_g_lf_r = []
-    final_res_st_r_lf_g = []
-    # 专门处理直行左转绿灯
-    for start_frame, end_frame in st_lf_green:
-        # start_idx = all_imgs.index(str(start_frame) + '.png')
-        # end_idx = all_imgs.index(str(end_frame) + '.png')
-        start_idx = start_frame
-        end_idx = end_frame
-        count = start_idx
-        img_list = []
-        # import pdb;pdb.set_trace()
-        while count <= end_idx:
-            img_list.append(all_imgs[count])
-            count = count + interval
-            if len(img_list) == 10:
-                final_res_st_lf_green.append(dict(images = img_list, label = [1, 0, 1, 0]))
-                img_list = []
-    
-    #专门处理直行左转红灯
-    for start_frame, end_frame in st_lf_red:
-        # start_idx = all_imgs.index(str(start_frame) + '.png')
-        # end_idx = all_imgs.index(str(end_frame) + '.png')
-        start_idx = start_frame
-        end_idx = end_frame
-        count = start_idx
-        img_list = []
-        while count <= end_idx:
-            img_list.append(all_imgs[count])
-            count = count + interval
-            if len(img_list) == 10:
-                final_res_st_lf_red.append(dict(images = img_list, label = [0, 1, 0, 1]))
-                img_list = []
-
-    #专门处理直行绿灯左转红灯
-    for start_frame, end_frame in st_g_lf_r:
-        # start_idx = all_imgs.index(str(start_frame) + '.png')
-        # end_idx = all_imgs.index(str(end_frame) + '.png')
-        start_idx = start_frame
-        end_idx = end_frame
-        count = start_idx
-        img_list = []
-        while count <= end_idx:
-            img_list.append(all_imgs[count])
-            count = count + interval
-            if len(img_list) == 10:
-                final_res_st_g_lf_r.append(dict(images = img_list, label = [1, 0, 0, 1]))
-                img_list = []
+def read_intervals(path):
+    """
+    Label intervals of a clip, [(start, end, label)], from lines `start end name` (a key of
+    LABELS) or `start end st_green st_red lf_green lf_red`, with inclusive frame indices into
+    the sorted frames of the clip. Empty lines and lines starting with # are skipped.
+    """
+    intervals = []
+    with open(path, 'r') as f:
+        for line_num, line in enumerate(f, 1):
+            fields = line.split('#')[0].split()
+            if not fields:
+                continue
+            if len(fields) == 3 and fields[2] in LABELS:
+                label = LABELS[fields[2]]
+            elif len(fields) == 6:
+                label = [int(x) for x in fields[2:]]
+            else:
+                raise ValueError(f'{path}:{line_num}: expected `start end name` with a name of {list(LABELS)}, or `start end` and 4 label values')
+            intervals.append((int(fields[0]), int(fields[1]), label))
+    return intervals
 
-    #专门处理直行红灯左转绿灯
-    for start_frame, end_frame in st_r_lf_g:
-        # start_idx = all_imgs.index(str(start_frame) + '.png')
-        # end_idx = all_imgs.index(str(end_frame) + '.png')
-        start_idx = start_frame
-        end_idx = end_frame
-        count = start_idx
-        img_list = []
-        while count <= end_idx:
-            img_list.append(all_imgs[count])
-            count = count + interval
-            if len(img_list) == 10:
-                final_res_st_r_lf_g.append(dict(images = img_list, label = [0, 1, 1, 0]))
-                img_list = []
+def find_clips(roots, intervals_name):
+    """
+    Clip folders under roots, the folders holding a frames folder and an intervals_name file.
+    """
+    clips = []
+    for root in roots:
+        for folder, dirs, files in os.walk(root):
+            dirs.sort()
+            if intervals_name in files and 'frames' in dirs:
+                clips.append(folder)
+                dirs.remove('frames')
+    return clips
 
-    final_res = final_res_st_lf_green + final_res_st_lf_red + final_res_st_g_lf_r + final_res_st_r_lf_g
-    shuffle(final_res)
+def gather_info(img_folder, intervals, length=10, stride=None, interval=1):
+    """
+    Windows of `length` frames, `interval` frames apart, starting every `stride` frames
+    (length x interval, no overlap, by default) within each label interval of the frames in
+    img_folder. Windows do not cross interval ends, a shorter remainder is dropped.
+    """
+    stride = stride or length * interval
+    all_imgs = np.array(sorted(x for x in os.listdir(img_folder) if not x.startswith('.')))
+    offsets = np.arange(length) * interval
+    final_res = []
+    for start_frame, end_frame, label in intervals:
+        if not 0 <= start_frame <= end_frame < len(all_imgs):
+            raise ValueError(f'interval [{start_frame}, {end_frame}] outside the {len(all_imgs)} frames of {img_folder}')
+        starts = np.arange(start_frame, end_frame - offsets[-1] + 1, stride)
+        for img_list in all_imgs[starts[:, None] + offsets].tolist():
+            final_res.append(dict(images = img_list, label = label))
     return final_res
 
-def write_json(json_res, out_path):
-    with open(os.path.join(out_path, 'samples.json'), 'w') as f:
-        json.dump(json_res, f)
+def build_clip(clip, intervals_name='label_intervals.txt', out='samples.json', length=10, stride=None, interval=1, shuffle_samples=False):
+    """
+    Write the windows of one clip folder to clip/out, returns (clip, samples).
+    """
+    samples = gather_info(os.path.join(clip, 'frames'), read_intervals(os.path.join(clip, intervals_name)), length, stride, interval)
+    if shuffle_samples:
+        random.Random(clip).shuffle(samples)
+    write_json(samples, os.path.dirname(os.path.join(clip, out)), os.path.basename(out))
+    return clip, len(samples)
+
+def _build_clip(args):
+    return build_clip(*args)
+
+def write_json(json_res, out_path, name='samples.json'):
+    """
+    Stream the samples to out_path/name one at a time, replacing the file once it is complete.
+    """
+    os.makedirs(out_path, exist_ok=True)
+    path = os.path.join(out_path, name)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write('[')
+        for i, sample in enumerate(json_res):
+            f.write(', ' if i else '')
+            json.dump(sample, f)
+        f.write(']')
+    os.replace(tmp_path, path)
 
 def write_train_test_json(json_res, green_res, red_res, out_path=None):
     all_green_samples = len(green_res)
@@ -134,11 +153,21 @@ def rearrange_json(in_path, out_path=None):
         json.dump(new_output, f) 
 
 if __name__ == "__main__":
-    img_folder = '/media/tao/Data_Use/Light_Former/data/Kaggle_Dataset/nightTrain/nightTrain/nightClip5/frames'
-    out_path = '/media/tao/Data_Use/Light_Former/data/Kaggle_Dataset/nightTrain/nightTrain/nightClip5/train'
-    json_res = gather_info(img_folder)
-    write_json(json_res, out_path)
+    args = parse_args()
+    clips = find_clips(args.roots, args.intervals)
+    if not clips:
+        print(f'No clip folders with a frames folder and {args.intervals} found')
+        exit(0)
+    jobs = [(clip, args.intervals, args.out, args.length, args.stride, args.frame_interval, args.shuffle) for clip in clips]
+    total = 0
+    print('| clip | samples |')
+    print('|---|---|')
+    with Pool(min(args.processes, len(clips))) as pool:
+        for clip, samples in pool.imap_unordered(_build_clip, jobs):
+            total += samples
+            print(f'| {clip} | {samples} |')
+    print(f'{total} samples from {len(clips)} clips')
     # write_train_test_json(json_res, green_res, red_res, out_path)
     # in_path = "/media/tao/Data_Use/Traffic_Light_Model/prediction_ml_framework/data/balanced_data/train/samples.json"
     # out_path = "/media/tao/Data_Use/Traffic_Light_Model/prediction_ml_framework/data/balanced_data/st_lf_test"
-    # rearrange_json(in_path, out_path)
\ No newline at end of file
+    # rearrange_json(in_path, out_path)
@@ -6,68 +6,128 @@ from torchvision import transforms
 import numpy as np
 import json
 import os
-from skimage import io
-from skimage.transform import resize
-from pathlib import Path
+import hashlib
+from .decode import get_decode_backend
+from .sample_index import SampleIndex
 
 
 class LightFormerDataset(Dataset):
     """
     Custom LightFormer Dataset.
     https://pytorch.org/tutorials/beginner/basics/data_tutorial.html#creating-a-custom-dataset-for-your-files
+
+    Frames are returned as uint8, scaling and normalization run batched on the model device
+    (see LightFormer.normalize).
     """
 
-    def __init__(self, img_dir, transform=None):
+    def __init__(self, img_dir, transform=None, frame_cache=None, frame_store=None, decode_backend='skimage', feature_store=None,
+                 image_num=10, image_size=(512, 960)):
         """
         Args:
             img_dir (list): Paths to the image directories, which should include a .json with annotations.
-            transform (callable, optional): Optional transform to be applied on a sample.
+            transform (callable, optional): Optional transform to be applied on the uint8 frames of a sample.
+            frame_cache (SharedFrameCache, optional): Cache of decoded, resized frames shared by all workers.
+            frame_store (FrameStore, optional): Preprocessed frames, read instead of decoding the images.
+            decode_backend (str): Name of the frame decode backend, see dataset.decode.DECODE_BACKENDS.
+            feature_store (FeatureStore, optional): Precomputed down_conv features of a frozen backbone,
+                samples then hold 'features' instead of 'images'.
+            image_num (int): Window length, shorter samples are zero padded and report their valid 'length'.
+            image_size (tuple): Frame height and width the images are resized to.
         """
 
         self.img_dir = img_dir
-        self.landmarks_frame = []
-        self.root_dir_list = []
         self.transform = transform
+        self.frame_cache = frame_cache
+        self.frame_store = frame_store
+        self.decode = get_decode_backend(decode_backend)
+        self.feature_store = feature_store
+        self.image_num = image_num
+        self.image_size = tuple(image_size)
 
         # handle a list of img_dir
-        for sub_path in self.img_dir:
-            json_files = sorted(os.path.join(sub_path, x) for x in os.listdir(sub_path) if (x.endswith('.json')))
-            for x in json_files:
-                with open(x, 'r') as opened_file:
-                    sample = json.load(opened_file)
-                    self.landmarks_frame += sample
-                    self.root_dir_list += len(sample) * [Path(sub_path)]
+        self.index = SampleIndex(self.img_dir)
 
     def __len__(self):
-        return len(self.landmarks_frame)
+        return len(self.index)
+
+    def load_frame(self, image_path):
+        """
+        Decode a frame and resize it to the model resolution, as a C x H x W uint8 tensor.
+        """
+        return self.decode(image_path, self.image_size)
+
+    def read_frame(self, image_path):
+        if self.frame_cache is None:
+            return self.load_frame(image_path)
+        return self.frame_cache.get_or_load(image_path, self.load_frame)
+
+    def read_window(self, image_paths):
+        """
+        Frames of one sample as a N x C x H x W uint8 tensor.
+        """
+        if self.frame_store is not None:
+            rows = [self.frame_store.row(image_path) for image_path in image_paths]
+            return self.frame_store.window(rows)
+        return torch.stack([self.read_frame(image_path) for image_path in image_paths])
+
+    def sample_key(self, idx):
+        """
+        Content key of a sample: the paths, sizes and modification times of its window frames.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for image_path in self.index.sample_paths(idx)[-self.image_num:]:
+            try:
+                stat = os.stat(image_path)
+                digest.update(f'{image_path}:{stat.st_size}:{stat.st_mtime_ns}\n'.encode('utf-8'))
+            except OSError:
+                digest.update(f'{image_path}\n'.encode('utf-8'))
+        return digest.hexdigest()
+
+    def pad(self, window):
+        """
+        Zero pad a window of N frames or features to image_num, the model masks the padding by the sample's length.
+        """
+        if len(window) >= self.image_num:
+            return window
+        padded = window.new_zeros((self.image_num, *window.shape[1:]))
+        padded[:len(window)] = window
+        return padded
+
+    def read_features(self, image_paths):
+        """
+        Stored features of one sample as a N x 256 x h x w tensor.
+        """
+        rows = [self.feature_store.row(image_path) for image_path in image_paths]
+        return self.feature_store.window(rows)
 
     def __getitem__(self, idx):
         if torch.is_tensor(idx):
             idx = idx.tolist()
-        img_names = self.landmarks_frame[idx]['images']
-        root_dir = self.root_dir_list[idx]
-        images = torch.from_numpy(np.zeros((10,3,512,960),dtype='float32'))
-        for i,img_name in enumerate(img_names):
-            image_path = os.path.join(root_dir, 'frames', img_name)
-            image = io.imread(image_path)
-            image = resize(image, (512, 960), anti_aliasing=True)
-            # numpy image: H x W x C
-            # torch image: C x H x W
-            image = image.transpose((2, 0, 1)) / 255.0
-            image = image.astype('float32')
-            image = torch.from_numpy(image)
-            image = self.transform(image)
-            images[i] = image
-
-        label = self.landmarks_frame[idx]['label'][:4]
-        label = np.array([label])
-        label = label.astype('float32')
-        label = torch.from_numpy(label)
-        label = label.squeeze()
+        image_paths = self.index.sample_paths(idx)
+        name = os.path.basename(image_paths[0])
+        # Windows longer than image_num keep their most recent frames
+        image_paths = image_paths[-self.image_num:]
+        label = torch.from_numpy(self.index.labels[idx])
+        if self.feature_store is not None:
+            return {
+                'features': self.pad(self.read_features(image_paths)),
+                'length': len(image_paths),
+                'label': label,
+                'name': name,
+                'index': idx,
+                'clip_id': int(self.index.sample_clips[idx]),
+            }
+        images = self.pad(self.read_window(image_paths))
+        if self.transform is not None:
+            images = self.transform(images)
+
         sample = {
             'images': images,
+            'length': len(image_paths),
             'label': label,
-            'name': img_names[0],
+            'name': name,
+            'index': idx,
+            'clip_id': int(self.index.sample_clips[idx]),
         }
 
         return sample
@@ -0,0 +1,56 @@
+import numpy as np
+import torch
+from skimage import io
+from skimage.transform import resize
+
+
+# Frame decode backends. Each one reads an image file and returns it resized to
+# size = (h, w) as a C x H x W uint8 RGB tensor.
+
+def decode_skimage(image_path, size):
+    """
+    Reference backend: Gaussian prefiltered float64 interpolation, slow but what the model was trained on.
+    """
+    image = io.imread(image_path)
+    image = resize(image, size, anti_aliasing=True, preserve_range=True)
+    # numpy image: H x W x C
+    # torch image: C x H x W
+    image = np.round(image.transpose((2, 0, 1))).astype('uint8')
+    return torch.from_numpy(image)
+
+
+def decode_opencv(image_path, size):
+    """
+    libpng/libjpeg decode and INTER_AREA resize, entirely in uint8.
+    """
+    import cv2
+    image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise FileNotFoundError(f"Could not read image {image_path}")
+    image = cv2.resize(image, (size[1], size[0]), interpolation=cv2.INTER_AREA)
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    return torch.from_numpy(np.ascontiguousarray(image.transpose((2, 0, 1))))
+
+
+def decode_torchvision(image_path, size):
+    """
+    torchvision.io decode and antialiased bilinear resize.
+    """
+    from torchvision.io import ImageReadMode, decode_image, read_file
+    image = decode_image(read_file(image_path), mode=ImageReadMode.RGB)
+    image = torch.nn.functional.interpolate(image[None].float(), size=size, mode='bilinear',
+                                            align_corners=False, antialias=True)
+    return image[0].round().clamp(0, 255).to(torch.uint8)
+
+
+DECODE_BACKENDS = {
+    'skimage': decode_skimage,
+    'opencv': decode_opencv,
+    'torchvision': decode_torchvision,
+}
+
+
+def get_decode_backend(name):
+    if name not in DECODE_BACKENDS:
+        raise ValueError(f"Unknown decode backend '{name}', expected one of {sorted(DECODE_BACKENDS)}")
+    return DECODE_BACKENDS[name]
@@ -0,0 +1,34 @@
+import os
+import torch
+from .frame_store import FrameStore
+
+
+class FeatureStore(FrameStore):
+    """
+    Memory mapped store of per-frame down_conv features [256, h, w] of a frozen backbone,
+    written by tools/build_feature_store.py and read instead of the frames.
+
+    Besides the FrameStore files, the directory holds `backbone.pt`, the backbone and down_conv
+    weights the features were computed with.
+    """
+
+    def backbone_state_dict(self):
+        """
+        LightFormer state dict entries of the backbone the features were computed with.
+        """
+        return torch.load(os.path.join(self.store_dir, 'backbone.pt'), map_location='cpu')
+
+    @staticmethod
+    def create(store_dir, paths, frame_shape, dtype, frames, backbone_state_dict=None):
+        """
+        Write a new store, see FrameStore.create.
+
+        Args:
+            backbone_state_dict (dict): backbone.* and down_conv.* weights of the LightFormer that computed the features.
+        """
+        os.makedirs(store_dir, exist_ok=True)
+        index_path = os.path.join(store_dir, 'index.json')
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        torch.save(backbone_state_dict, os.path.join(store_dir, 'backbone.pt'))
+        FrameStore.create(store_dir, paths, frame_shape, dtype, frames)
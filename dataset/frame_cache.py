@@ -0,0 +1,115 @@
+import hashlib
+import math
+import multiprocessing as mp
+import torch
+
+
+def _path_key(path):
+    """
+    Stable 63 bit key for a frame path. The builtin hash() is salted per process,
+    so spawned workers would disagree on it.
+    """
+    digest = hashlib.blake2b(str(path).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') & 0x7FFFFFFFFFFFFFFF
+
+
+class SharedFrameCache:
+    """
+    Size bounded LRU cache of decoded frames, shared by all DataLoader workers.
+
+    Frames live in one preallocated shared memory tensor of `capacity` slots. The slot
+    table (path keys and last use ticks) and the hit/miss counters are shared tensors as
+    well, so every worker the dataset is forked or pickled into sees the same cache.
+    """
+
+    def __init__(self, capacity, frame_shape, dtype=torch.float32, mp_context=None):
+        """
+        Args:
+            capacity (int): Number of frames the cache can hold.
+            frame_shape (tuple): Shape of a single cached frame, e.g. (3, 512, 960).
+            dtype (torch.dtype): Dtype of the cached frames.
+            mp_context (str, optional): Multiprocessing start method of the DataLoader workers, default if None.
+        """
+        if capacity < 1:
+            raise ValueError(f"Frame cache capacity must be at least 1, got {capacity}")
+        self.capacity = capacity
+        self.frame_shape = tuple(frame_shape)
+        self.frames = torch.empty((capacity, *self.frame_shape), dtype=dtype).share_memory_()
+        self.keys = torch.full((capacity,), -1, dtype=torch.int64).share_memory_()
+        self.ticks = torch.zeros(capacity, dtype=torch.int64).share_memory_()
+        # [clock, hits, misses]
+        self.counters = torch.zeros(3, dtype=torch.int64).share_memory_()
+        self.lock = mp.get_context(mp_context).Lock()
+
+    @classmethod
+    def from_megabytes(cls, size_mb, frame_shape, dtype=torch.float32, mp_context=None):
+        """
+        Build a cache holding as many frames as fit into `size_mb` megabytes.
+        """
+        frame_bytes = torch.empty((), dtype=dtype).element_size() * math.prod(frame_shape)
+        return cls(max(1, int(size_mb * 2**20) // frame_bytes), frame_shape, dtype, mp_context)
+
+    def _find(self, key):
+        match = (self.keys == key).nonzero()
+        if len(match) == 0:
+            return None
+        return int(match[0])
+
+    def _touch(self, slot):
+        self.counters[0] += 1
+        self.ticks[slot] = self.counters[0]
+
+    def get(self, path):
+        """
+        Return a copy of the cached frame for `path`, or None on a miss.
+        """
+        key = _path_key(path)
+        with self.lock:
+            slot = self._find(key)
+            if slot is None:
+                self.counters[2] += 1
+                return None
+            self.counters[1] += 1
+            self._touch(slot)
+            return self.frames[slot].clone()
+
+    def put(self, path, frame):
+        """
+        Insert `frame` for `path`, evicting the least recently used frame when full.
+        """
+        key = _path_key(path)
+        with self.lock:
+            slot = self._find(key)
+            if slot is None:
+                # Empty slots keep tick 0, so they are filled before anything is evicted
+                slot = int(torch.argmin(self.ticks))
+                self.frames[slot].copy_(frame)
+                self.keys[slot] = key
+            self._touch(slot)
+
+    def get_or_load(self, path, loader):
+        """
+        Return the cached frame for `path`, decoding it with `loader(path)` on a miss.
+        """
+        frame = self.get(path)
+        if frame is None:
+            frame = loader(path)
+            self.put(path, frame)
+        return frame
+
+    def stats(self):
+        """
+        Hit/miss counters accumulated over all workers.
+        """
+        with self.lock:
+            hits = int(self.counters[1])
+            misses = int(self.counters[2])
+            used = int((self.keys >= 0).sum())
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else 0.0,
+            'used': used,
+            'capacity': self.capacity,
+        }
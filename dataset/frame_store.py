@@ -0,0 +1,104 @@
+import json
+import os
+import re
+import numpy as np
+import torch
+
+
+def _natural_key(path):
+    """
+    Sort key that orders '998.png' before '1000.png'.
+    """
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', path)]
+
+
+class FrameStore:
+    """
+    Memory mapped store of preprocessed frames.
+
+    A store directory holds `frames.bin`, a raw (N, *frame_shape) array, and `index.json`
+    with its dtype, shape and the row of every frame path. Frames of a clip are written in
+    frame order, so the frames of a window usually occupy consecutive rows and can be
+    sliced out of the page cache without a copy.
+    """
+
+    def __init__(self, store_dir):
+        """
+        Args:
+            store_dir (str): Directory written by FrameStore.create.
+        """
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, 'index.json'), 'r') as f:
+            meta = json.load(f)
+        self.shape = tuple(meta['shape'])
+        self.dtype = np.dtype(meta['dtype'])
+        self.rows = meta['rows']
+        self._array = None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getstate__(self):
+        # Never pickle the mapped data into dataloader workers, each worker maps the file itself
+        state = self.__dict__.copy()
+        state['_array'] = None
+        return state
+
+    @property
+    def array(self):
+        if self._array is None:
+            # Copy-on-write mapping: pages stay shared between processes and torch gets a writable array
+            self._array = np.memmap(os.path.join(self.store_dir, 'frames.bin'),
+                                    dtype=self.dtype, mode='c', shape=self.shape)
+        return self._array
+
+    def row(self, path):
+        return self.rows[os.path.abspath(path)]
+
+    def window(self, rows):
+        """
+        Return the frames at `rows` as a tensor, a view into the mapping when the rows are consecutive.
+        """
+        start = rows[0]
+        if list(rows) == list(range(start, start + len(rows))):
+            return torch.from_numpy(self.array[start:start + len(rows)])
+        return torch.from_numpy(self.array[rows])
+
+    @staticmethod
+    def create(store_dir, paths, frame_shape, dtype, frames):
+        """
+        Write a new store.
+
+        Args:
+            store_dir (str): Output directory.
+            paths (list): Frame paths, one row each, in the order `frames` yields them.
+            frame_shape (tuple): Shape of a single frame.
+            dtype (str): Numpy dtype of the stored frames.
+            frames (iterable): Arrays of `frame_shape`, one per path.
+        """
+        os.makedirs(store_dir, exist_ok=True)
+        index_path = os.path.join(store_dir, 'index.json')
+        if os.path.exists(index_path):
+            # The index marks a complete store, drop it first so an interrupted rewrite is never used
+            os.remove(index_path)
+        shape = (len(paths), *frame_shape)
+        array = np.memmap(os.path.join(store_dir, 'frames.bin'), dtype=dtype, mode='w+', shape=shape)
+        for i, frame in enumerate(frames):
+            array[i] = frame
+        array.flush()
+        del array
+        meta = {
+            'shape': list(shape),
+            'dtype': np.dtype(dtype).name,
+            'rows': {os.path.abspath(path): i for i, path in enumerate(paths)},
+        }
+        with open(index_path, 'w') as f:
+            json.dump(meta, f)
+
+    @staticmethod
+    def sort_paths(paths):
+        """
+        Unique frame paths grouped by clip folder and in frame order within each clip.
+        """
+        unique = {os.path.abspath(path) for path in paths}
+        return sorted(unique, key=lambda path: (os.path.dirname(path), _natural_key(os.path.basename(path))))
@@ -0,0 +1,149 @@
+import json
+import os
+import numpy as np
+
+
+MANIFEST_NAME = '.sample_index.npz'
+MANIFEST_VERSION = 1
+
+
+def _json_files(folder):
+    return sorted(os.path.join(folder, x) for x in os.listdir(folder) if x.endswith('.json'))
+
+
+def _json_stamps(json_files):
+    stats = [os.stat(x) for x in json_files]
+    return np.array([[st.st_mtime_ns, st.st_size] for st in stats], dtype=np.int64).reshape(-1, 2)
+
+
+def _build_folder(json_files):
+    """
+    Parse the label files of one clip folder into arrays, interning the frame names.
+    """
+    frame_ids = {}
+    samples = []
+    labels = []
+    for x in json_files:
+        with open(x, 'r') as opened_file:
+            for sample in json.load(opened_file):
+                samples.append([frame_ids.setdefault(img_name, len(frame_ids)) for img_name in sample['images']])
+                labels.append(sample['label'][:4])
+    max_len = max((len(frames) for frames in samples), default=0)
+    sample_frames = np.full((len(samples), max_len), -1, dtype=np.int32)
+    for i, frames in enumerate(samples):
+        sample_frames[i, :len(frames)] = frames
+    return {
+        'frame_names': np.array(list(frame_ids), dtype=str),
+        'sample_frames': sample_frames,
+        'labels': np.array(labels, dtype=np.float32).reshape(-1, 4),
+    }
+
+
+def _load_manifest(path, json_files, stamps):
+    try:
+        with np.load(path, allow_pickle=False) as manifest:
+            if (int(manifest['version']) != MANIFEST_VERSION
+                    or manifest['json_files'].tolist() != [os.path.basename(x) for x in json_files]
+                    or not np.array_equal(manifest['json_stamps'], stamps)):
+                return None
+            return {key: manifest[key] for key in ('frame_names', 'sample_frames', 'labels')}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _save_manifest(path, json_files, stamps, arrays):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, version=MANIFEST_VERSION, json_files=np.array([os.path.basename(x) for x in json_files], dtype=str),
+                     json_stamps=stamps, **arrays)
+        os.replace(tmp_path, path)
+    except OSError:
+        # Read only dataset folders just go without a cached manifest
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_folder(folder):
+    """
+    Arrays of one clip folder, read from its cached manifest unless a label file changed since it was written.
+    """
+    json_files = _json_files(folder)
+    stamps = _json_stamps(json_files)
+    manifest_path = os.path.join(folder, MANIFEST_NAME)
+    arrays = _load_manifest(manifest_path, json_files, stamps)
+    if arrays is None:
+        arrays = _build_folder(json_files)
+        _save_manifest(manifest_path, json_files, stamps, arrays)
+    return arrays
+
+
+class SampleIndex:
+    """
+    Array backed index of the samples in a list of clip folders.
+
+    Frame names are interned once per clip and samples refer to them by integer id, so
+    the whole index is a handful of NumPy arrays instead of one Python dict per sample.
+    Forked dataloader workers share it without copying, and each folder's arrays are
+    cached next to its label files in a manifest that is rebuilt when a .json changes.
+
+    Attributes:
+        clip_dirs (np.ndarray): [num_clips] clip folder paths.
+        frame_names (np.ndarray): [num_frames] file name of every interned frame.
+        frame_clips (np.ndarray): [num_frames] clip id of every interned frame.
+        sample_frames (np.ndarray): [num_samples, max_len] frame ids of each sample, -1 padded.
+        sample_lengths (np.ndarray): [num_samples] number of frames of each sample.
+        sample_clips (np.ndarray): [num_samples] clip id of each sample.
+        labels (np.ndarray): [num_samples, 4] float32 labels.
+    """
+
+    def __init__(self, img_dir):
+        """
+        Args:
+            img_dir (list): Paths to the clip folders, each with .json label files and a frames folder.
+        """
+        folders = [load_folder(sub_path) for sub_path in img_dir]
+        max_len = max((arrays['sample_frames'].shape[1] for arrays in folders), default=0)
+
+        self.clip_dirs = np.array([str(sub_path) for sub_path in img_dir], dtype=str)
+        frame_names, frame_clips, sample_frames, sample_clips, labels = [], [], [], [], []
+        num_frames = 0
+        for clip_id, arrays in enumerate(folders):
+            frames = arrays['sample_frames']
+            padded = np.full((len(frames), max_len), -1, dtype=np.int32)
+            padded[:, :frames.shape[1]] = np.where(frames >= 0, frames + num_frames, -1)
+            frame_names.append(arrays['frame_names'])
+            frame_clips.append(np.full(len(arrays['frame_names']), clip_id, dtype=np.int32))
+            sample_frames.append(padded)
+            sample_clips.append(np.full(len(frames), clip_id, dtype=np.int32))
+            labels.append(arrays['labels'])
+            num_frames += len(arrays['frame_names'])
+
+        self.frame_names = np.concatenate(frame_names) if folders else np.array([], dtype=str)
+        self.frame_clips = np.concatenate(frame_clips) if folders else np.array([], dtype=np.int32)
+        self.sample_frames = np.concatenate(sample_frames) if folders else np.zeros((0, 0), dtype=np.int32)
+        self.sample_clips = np.concatenate(sample_clips) if folders else np.array([], dtype=np.int32)
+        self.labels = np.concatenate(labels) if folders else np.zeros((0, 4), dtype=np.float32)
+        self.sample_lengths = (self.sample_frames >= 0).sum(axis=1).astype(np.int32)
+
+    def __len__(self):
+        return len(self.sample_frames)
+
+    @property
+    def num_frames(self):
+        return len(self.frame_names)
+
+    def frame_path(self, frame_id):
+        return os.path.join(self.clip_dirs[self.frame_clips[frame_id]], 'frames', self.frame_names[frame_id])
+
+    def sample_frame_ids(self, idx):
+        return self.sample_frames[idx, :self.sample_lengths[idx]]
+
+    def sample_paths(self, idx):
+        return [self.frame_path(frame_id) for frame_id in self.sample_frame_ids(idx)]
+
+    def frame_paths(self):
+        """
+        Paths of all frames referenced by at least one sample.
+        """
+        return [self.frame_path(frame_id) for frame_id in range(self.num_frames)]
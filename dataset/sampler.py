@@ -0,0 +1,24 @@
+from torch.utils.data.distributed import DistributedSampler
+
+
+class ShardSampler(DistributedSampler):
+    """
+    Contiguous, unpadded shard of the dataset for each process, for evaluation.
+
+    DistributedSampler repeats samples so that every process gets the same number, which
+    counts those samples twice in the test metrics. Here every sample is seen exactly once,
+    shards differ in length by at most one sample and keep the order of the dataset.
+    """
+
+    def __init__(self, dataset, num_replicas=None, rank=None):
+        super().__init__(dataset, num_replicas=num_replicas, rank=rank, shuffle=False)
+        self.start = len(dataset) * self.rank // self.num_replicas
+        self.stop = len(dataset) * (self.rank + 1) // self.num_replicas
+        self.num_samples = self.stop - self.start
+        self.total_size = len(dataset)
+
+    def __iter__(self):
+        return iter(range(self.start, self.stop))
+
+    def __len__(self):
+        return self.num_samples
@@ -1,33 +1,111 @@
 # Copyright (c) 2021 Li Auto Company. All rights reserved.
 
 import argparse
+import json
 import os
 import shutil
 import time
 import warnings
 import sys
 sys.path.append('.')
-import pytorch_lightning as pl
-import yaml
+import torch
+import torch.multiprocessing as mp
 from pytorch_lightning import seed_everything
 from pytorch_lightning.loggers import TensorBoardLogger
-from pytorch_lightning.plugins import DDPPlugin
+from torch.utils.data import DataLoader
+from analysis import print_accuracy, print_confusion_matrices, print_precision_recall_f1
+from dataset.sampler import ShardSampler
+from evaluation.metrics import CLASS_NAMES, evaluate
+from evaluation.results import ResultWriter
 from models.light_former import LightFormerPredictor
 warnings.filterwarnings("ignore", ".*Trying to infer the `batch_size` from an ambiguous collection.*")
 
 
 def parse_args() -> argparse.ArgumentParser:
-    parser = argparse.ArgumentParser(description='eval intention network.')
+    parser = argparse.ArgumentParser(description='eval intention network: shard the test set over local processes, write per process results and merge them into one metrics report.')
 
     parser.add_argument('-cfg', '--config', type=str, default='', required=True, help='config file')
     parser.add_argument('-ckpt', '--checkpoint', type=str, default=None, help='checkpoint file')
     parser.add_argument('-log', '--log_dir', type=str, default='./log', help='log directory')
-    parser.add_argument('-g', '--gpu', type=int, default=1, help='0: cpu, n: n num of gpus, -1: all gpus')
+    parser.add_argument('-p', '--processes', type=int, default=1, help='number of local evaluation processes')
+    parser.add_argument('-t', '--threads', type=int, default=None, help='torch threads per process, the cpu cores split evenly if not given')
+    parser.add_argument('--device', type=str, default='cpu', help='cpu, or cuda to give each process the gpu rank % device count')
+    parser.add_argument('--scaling', type=int, nargs='+', default=None, help='evaluate once per process count and report the wall clock scaling, instead of -p')
 
     args = parser.parse_args()
     return args
 
 
+def evaluate_shard(rank, num_processes, config, checkpoint_file, out_dir, threads, device, samples, cache_keys):
+    """
+    Batched inference over shard `rank` of the test samples (dataset indices, all if None),
+    written as result parts to out_dir and stored in the eval cache under cache_keys, if configured.
+    """
+    torch.set_num_threads(threads)
+    if device == 'cuda':
+        device = f'cuda:{rank % torch.cuda.device_count()}'
+    predictor = LightFormerPredictor.load_from_checkpoint(checkpoint_file, config=config, map_location='cpu')
+    predictor.eval().to(device)
+
+    test_set = predictor.test_dataset(samples, cache_keys=cache_keys)
+    loader = DataLoader(test_set,
+                        batch_size=config['test']['batch_size'],
+                        sampler=ShardSampler(test_set, num_replicas=num_processes, rank=rank),
+                        num_workers=config['test']['loader_worker_num'])
+    writer = ResultWriter(out_dir, config['test']['sample_database_folder'], rank)
+    for batch in loader:
+        images = batch['images'].to(device) if 'images' in batch else None
+        features = batch['features'].to(device) if 'features' in batch else None
+        st_prob, lf_prob = predictor.predict_probs(images, features, batch['length'].to(device))
+        writer.add(batch['index'], batch['clip_id'], batch['name'], st_prob, lf_prob,
+                   batch['label'][:, :2].argmax(dim=1), batch['label'][:, 2:4].argmax(dim=1))
+        predictor.cache_predictions(batch['index'], st_prob, lf_prob)
+    writer.close()
+
+
+def run(config, checkpoint_file, out_dir, num_processes, threads, device, samples=None, cached=None, cache_keys=None):
+    """
+    Evaluate the test samples (dataset indices, all if None) with num_processes processes into
+    out_dir, next to the `cached` results of the eval cache. The processes store their
+    predictions under `cache_keys`, see LightFormerPredictor.cache_keys. Returns the wall clock seconds.
+    """
+    threads = threads or max(1, os.cpu_count() // num_processes)
+    start = time.perf_counter()
+    if cached is not None:
+        writer = ResultWriter(out_dir, config['test']['sample_database_folder'])
+        writer.add(**cached)
+        writer.close()
+    if samples is None or len(samples):
+        mp.start_processes(evaluate_shard, args=(num_processes, config, checkpoint_file, out_dir, threads, device, samples, cache_keys),
+                           nprocs=num_processes, start_method='spawn')
+    return time.perf_counter() - start
+
+
+def report(out_dir, seconds, num_processes, neck_stats):
+    """
+    Merge the result parts of out_dir into metrics, print them and save them as metrics.json.
+    """
+    metrics = evaluate(out_dir)
+    summary = metrics.summary()
+    result = {
+        'processes': num_processes,
+        'seconds': seconds,
+        'samples_per_second': summary['samples'] / seconds,
+        'summary': summary,
+        'confusion': {direction: matrix.tolist() for direction, matrix in metrics.confusion_matrices().items()},
+        'per_clip': metrics.per_clip(),
+        **neck_stats,
+    }
+    with open(os.path.join(out_dir, 'metrics.json'), 'w') as f:
+        json.dump(result, f, indent=2)
+
+    print(f"{summary['samples']} samples in {seconds:.1f} s with {num_processes} processes, {result['samples_per_second']:.2f} samples/s")
+    print_accuracy(summary)
+    print_precision_recall_f1({key: summary[key] for key in summary if key.endswith(CLASS_NAMES)})
+    print_confusion_matrices(metrics.confusion_matrices())
+    return result
+
+
 if __name__ == '__main__':
     # Must set seed everything in multi node multi gpus training
     seed: int = 42  # Magic number for deep leanrning
@@ -38,13 +116,13 @@ if __name__ == '__main__':
     # load config
     config_file = args.config
     print(f'Using config: {config_file}')
-    with open(config_file, 'rb') as f:
-        config = yaml.safe_load(f)
+    with open(config_file, 'r') as f:
+        config = json.load(f)
 
-    # set GPU device
-    gpu_num = args.gpu
-    if gpu_num == 0:
-        print('Gpu not specified, exit normally')
+    # set process count
+    process_counts = args.scaling or [args.processes]
+    if min(process_counts) < 1:
+        print('Process count must be greater than 0')
         exit(0)
 
     # create logger
@@ -54,10 +132,10 @@ if __name__ == '__main__':
     tb_logger = TensorBoardLogger(log_dir, name=config['model_name'])
 
     # create test result dir
-    if 'test_result_pkl_dir' in config['test']:
-        test_result_pkl_dir = config['test']['test_result_pkl_dir']
+    test_result_pkl_dir = config['test'].get('test_result_pkl_dir')
     if test_result_pkl_dir is None:
         print('Test result dir not specified, exit normally')
+        exit(0)
     if os.path.exists(test_result_pkl_dir):
         output_database_folder_tmp = test_result_pkl_dir + "_" + time.strftime("%Y-%m-%d_%H:%M:%S",
                                                                                time.localtime(time.time()))
@@ -66,9 +144,6 @@ if __name__ == '__main__':
     if not os.path.exists(test_result_pkl_dir):
         os.makedirs(test_result_pkl_dir)
 
- 
-    predictor = LightFormerPredictor(config=config)
-
     # set checkpoint path
     checkpoint_file = args.checkpoint
     if checkpoint_file is None:
@@ -76,14 +151,42 @@ if __name__ == '__main__':
         exit(0)
     print(f'Using checkpoint: {checkpoint_file}')
 
-    trainer = pl.Trainer(
-        gpus=gpu_num,
-        logger=tb_logger,
-        sync_batchnorm=True,
-        accelerator="gpu",
-        strategy=DDPPlugin(find_unused_parameters=False),
-        replace_sampler_ddp=True,
-        deterministic=True,
-    )
-
-    trainer.test(predictor, ckpt_path=checkpoint_file)
+    predictor = LightFormerPredictor.load_from_checkpoint(checkpoint_file, config=config, map_location='cpu')
+    neck_stats = predictor.neck_stats()
+    # Hash the weights and frames and look up the eval cache once, the processes only
+    # evaluate the samples it misses, under the keys computed here
+    cache, samples, cached, cache_keys = predictor.eval_cache(), None, None, None
+    if cache is not None:
+        samples = predictor.test_dataset().indices
+        cached = predictor.cached_test_results()
+        cache_keys = predictor.cache_keys(samples)
+    del predictor
+
+    results = []
+    for num_processes in process_counts:
+        # One result directory per process count when measuring the scaling
+        out_dir = os.path.join(test_result_pkl_dir, f'processes_{num_processes}') if args.scaling else test_result_pkl_dir
+        seconds = run(config, checkpoint_file, out_dir, num_processes, args.threads, args.device, samples, cached, cache_keys)
+        results.append(report(out_dir, seconds, num_processes, neck_stats))
+    if cache is not None:
+        print(f'Eval cache: {cache.evict()} least recently used entries evicted')
+
+    summary = results[-1]['summary']
+    tb_logger.log_metrics({
+        'test/st_acc': summary['Go Straight accuracy'],
+        'test/lf_acc': summary['Left Turn accuracy'],
+        'test/acc': summary['accuracy'],
+        'test/samples_per_second': results[-1]['samples_per_second'],
+    })
+    tb_logger.save()
+    print(f"neck {config.get('neck', 'conv')}: {neck_stats['neck/params_m']:.2f}M params, {neck_stats['neck/ms_per_frame']:.2f} ms/frame, "
+          f"straight acc {summary['Go Straight accuracy']*100:.2f}%, left turn acc {summary['Left Turn accuracy']*100:.2f}%, overall acc {summary['accuracy']*100:.2f}%")
+
+    if args.scaling:
+        print(f'| processes | wall clock (s) | samples / s | speedup | efficiency |')
+        print(f'|---|---|---|---|---|')
+        baseline = results[0]
+        for result in results:
+            speedup = baseline['seconds'] / result['seconds']
+            efficiency = speedup * baseline['processes'] / result['processes']
+            print(f"| {result['processes']} | {result['seconds']:.1f} | {result['samples_per_second']:.2f} | {speedup:.2f}x | {efficiency*100:.0f}% |")
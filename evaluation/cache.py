@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import numpy as np
+import torch
+
+
+# Config entries that change what the model sees or how its outputs are decoded
+PREPROCESSING_KEYS = ('image_num', 'image_size', 'n', 'out_class_num')
+DATA_KEYS = ('decode_backend', 'feature_store')
+
+
+def model_key(module, config, precision='32-true'):
+    """
+    Hash of the weights and buffers of `module`, of the preprocessing config and of the
+    numeric precision the predictions run in (a Lightning precision like bf16-mixed).
+    Checkpoints of the same weights share a key whatever their optimizer state or epoch.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for name, tensor in module.state_dict().items():
+        tensor = tensor.detach().cpu().contiguous()
+        digest.update(f'{name}:{tensor.dtype}:{tuple(tensor.shape)}'.encode('utf-8'))
+        digest.update(tensor.reshape(-1).view(torch.uint8).numpy())
+    preprocessing = {key: config.get(key) for key in PREPROCESSING_KEYS}
+    preprocessing.update({key: config.get('data', {}).get(key) for key in DATA_KEYS})
+    preprocessing['precision'] = str(precision)
+    digest.update(json.dumps(preprocessing, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class EvalCache:
+    """
+    Size bounded LRU cache of test predictions in a local SQLite database, keyed by
+    (model_key, sample key), see model_key and LightFormerDataset.sample_key.
+
+    Each entry holds the straight and left turn probabilities of one sample. Entries are
+    touched on every hit, and evict, called once per evaluation, drops the least recently
+    used until the stored entries fit into `max_mb`. The database runs in WAL mode, so
+    several evaluation processes can read and write it at once. The connection is opened
+    on first use in each process.
+    """
+
+    def __init__(self, path, max_mb=1024):
+        """
+        Args:
+            path (str): SQLite database file, created with its directory if missing.
+            max_mb (float): Size of the stored entries above which the least recently used are evicted.
+        """
+        self.path = path
+        self.max_bytes = int(max_mb * 2**20)
+        self._connection = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        return state
+
+    def connection(self):
+        if self._connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=60)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS predictions ('
+                                     'model TEXT, sample TEXT, probs BLOB, size INTEGER, last_used INTEGER, '
+                                     'PRIMARY KEY (model, sample))')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS predictions_last_used ON predictions (last_used)')
+            self._connection.commit()
+        return self._connection
+
+    def get(self, model, samples, num_classes=2):
+        """
+        Cached predictions of the samples: {sample key: (st_prob, lf_prob)} for every hit.
+        """
+        connection = self.connection()
+        hits = {}
+        samples = list(samples)
+        for start in range(0, len(samples), 500):
+            chunk = samples[start:start + 500]
+            rows = connection.execute(f"SELECT sample, probs FROM predictions WHERE model = ? AND sample IN ({','.join('?' * len(chunk))})",
+                                      [model, *chunk]).fetchall()
+            for sample, probs in rows:
+                probs = np.frombuffer(probs, dtype=np.float32)
+                hits[sample] = (probs[:num_classes], probs[num_classes:])
+        if hits:
+            with connection:
+                connection.executemany('UPDATE predictions SET last_used = ? WHERE model = ? AND sample = ?',
+                                       [(time.time_ns(), model, sample) for sample in hits])
+        return hits
+
+    def put(self, model, samples, st_prob, lf_prob):
+        """
+        Store the predictions of a batch of samples, st_prob and lf_prob [B, num_classes].
+        """
+        st_prob = np.asarray(st_prob, dtype=np.float32)
+        lf_prob = np.asarray(lf_prob, dtype=np.float32)
+        now = time.time_ns()
+        rows = []
+        for sample, st, lf in zip(samples, st_prob, lf_prob):
+            probs = np.concatenate([st, lf]).tobytes()
+            rows.append((model, sample, probs, len(model) + len(sample) + len(probs), now))
+        with self.connection() as connection:
+            connection.executemany('INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?)', rows)
+
+    def size(self):
+        return self.connection().execute('SELECT COALESCE(SUM(size), 0) FROM predictions').fetchone()[0]
+
+    def evict(self):
+        """
+        Delete the least recently used entries until the stored entries fit into max_mb.
+        """
+        excess = self.size() - self.max_bytes
+        if excess <= 0:
+            return 0
+        with self.connection() as connection:
+            rows = connection.execute('SELECT rowid, size FROM predictions ORDER BY last_used')
+            victims = []
+            for rowid, size in rows:
+                if excess <= 0:
+                    break
+                victims.append((rowid,))
+                excess -= size
+            connection.executemany('DELETE FROM predictions WHERE rowid = ?', victims)
+        return len(victims)
@@ -0,0 +1,245 @@
+import glob
+import itertools
+import os
+import numpy as np
+
+
+# Class indices of the labels: [1, 0] is a green light (pass), [0, 1] a red one (stop)
+CLASS_NAMES = ('Pass', 'Stop')
+DIRECTIONS = ('Go Straight', 'Left Turn')
+
+
+def precision_recall_f1(confusion):
+    """
+    Per class precision, recall and F1 of confusion matrices [..., target, predict], vectorized
+    over any leading dimensions. Classes that are never predicted (or never targets) get 0.
+    """
+    confusion = np.asarray(confusion, dtype=np.float64)
+    tp = np.diagonal(confusion, axis1=-2, axis2=-1)
+    predicted = confusion.sum(axis=-2)
+    actual = confusion.sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(predicted > 0, tp / predicted, 0.0)
+        recall = np.where(actual > 0, tp / actual, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    return precision, recall, f1
+
+
+def accuracy(confusion):
+    confusion = np.asarray(confusion, dtype=np.float64)
+    total = confusion.sum(axis=(-2, -1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total > 0, np.trace(confusion, axis1=-2, axis2=-1) / total, 0.0)
+
+
+class StreamingMetrics:
+    """
+    Confusion matrices, per clip breakdowns and threshold sweeps, accumulated chunk by chunk.
+
+    Every update only adds to fixed size count arrays (np.bincount), so memory does not grow
+    with the number of predictions and chunks of millions of samples take milliseconds.
+    Threshold sweeps histogram the stored probability of each class into `num_bins` bins,
+    separately for samples of that class and the rest; the TP/FP counts at every threshold
+    are then cumulative sums of the histograms.
+    """
+
+    def __init__(self, num_classes=2, num_bins=1000):
+        self.num_classes = num_classes
+        self.num_bins = num_bins
+        # [direction, target, predict]
+        self.confusion = np.zeros((2, num_classes, num_classes), dtype=np.int64)
+        # samples with both directions correct, and all samples
+        self.both_correct = 0
+        self.total = 0
+        # [clip, direction, target, predict], rows in the order clips are first seen
+        self.clips = {}
+        self.clip_confusion = np.zeros((0, 2, num_classes, num_classes), dtype=np.int64)
+        # [direction, class, sample is of that class, bin] probability histograms
+        self.histograms = np.zeros((2, num_classes, 2, num_bins), dtype=np.int64)
+        self.has_probs = False
+
+    def _clip_rows(self, clip_id, clip_dirs):
+        """
+        Accumulator rows of the clip ids of a chunk, adding rows for clips not seen before.
+        """
+        names = clip_dirs if clip_dirs is not None else np.arange(int(clip_id.max()) + 1).astype(str)
+        rows = np.empty(len(names), dtype=np.int64)
+        for i, name in enumerate(names):
+            rows[i] = self.clips.setdefault(str(name), len(self.clips))
+        if len(self.clips) > len(self.clip_confusion):
+            grow = np.zeros((len(self.clips) - len(self.clip_confusion), *self.clip_confusion.shape[1:]), dtype=np.int64)
+            self.clip_confusion = np.concatenate([self.clip_confusion, grow])
+        return rows[clip_id]
+
+    def update(self, st_target, lf_target, st_predict=None, lf_predict=None, st_prob=None, lf_prob=None,
+               clip_id=None, clip_dirs=None):
+        """
+        Add a chunk of samples. Predictions default to the argmax of the probabilities.
+
+        st_target, lf_target, st_predict, lf_predict: [N] class indices
+        st_prob, lf_prob: [N, num_classes] class probabilities, needed for threshold sweeps
+        clip_id: [N] clip index of each sample, into clip_dirs if given
+        """
+        K = self.num_classes
+        targets = np.stack([st_target, lf_target]).astype(np.int64)
+        if st_predict is None:
+            st_predict = np.argmax(st_prob, axis=1)
+            lf_predict = np.argmax(lf_prob, axis=1)
+        predicts = np.stack([st_predict, lf_predict]).astype(np.int64)
+        cells = targets * K + predicts # [2, N]
+        for d in range(2):
+            self.confusion[d] += np.bincount(cells[d], minlength=K * K).reshape(K, K)
+        self.both_correct += int(np.count_nonzero((targets == predicts).all(axis=0)))
+        self.total += targets.shape[1]
+
+        if clip_id is not None and len(clip_id):
+            rows = self._clip_rows(np.asarray(clip_id, dtype=np.int64), clip_dirs)
+            cells = (rows * 2 + np.arange(2)[:, None]) * K * K + cells
+            self.clip_confusion += np.bincount(cells.ravel(), minlength=self.clip_confusion.size).reshape(self.clip_confusion.shape)
+
+        if st_prob is not None:
+            self.has_probs = True
+            probs = np.stack([st_prob, lf_prob]).astype(np.float64) # [2, N, K]
+            bins = np.minimum((probs * self.num_bins).astype(np.int64), self.num_bins - 1)
+            is_class = targets[:, :, None] == np.arange(K) # [2, N, K]
+            index = ((np.arange(2)[:, None, None] * K + np.arange(K)) * 2 + is_class) * self.num_bins + bins
+            self.histograms += np.bincount(index.ravel(), minlength=self.histograms.size).reshape(self.histograms.shape)
+
+    def update_results(self, results):
+        """
+        Add a chunk of result columns, as written by evaluation.results.ResultWriter or read by read_chunks.
+        """
+        self.update(results['st_target'], results['lf_target'], results.get('st_predict'), results.get('lf_predict'),
+                    results.get('st_prob'), results.get('lf_prob'), results.get('clip_id'), results.get('clip_dirs'))
+
+    def summary(self):
+        """
+        Accuracy of each direction and overall (both directions correct), and precision,
+        recall and F1 of every class of each direction, keyed like 'Go Straight Pass'.
+        """
+        precision, recall, f1 = precision_recall_f1(self.confusion)
+        direction_accuracy = accuracy(self.confusion)
+        metrics = {'samples': self.total, 'accuracy': self.both_correct / self.total if self.total else 0.0}
+        for d, direction in enumerate(DIRECTIONS):
+            metrics[f'{direction} accuracy'] = float(direction_accuracy[d])
+            for c, name in enumerate(CLASS_NAMES):
+                metrics[f'{direction} {name}'] = (float(precision[d, c]), float(recall[d, c]), float(f1[d, c]))
+        return metrics
+
+    def confusion_matrices(self):
+        """
+        {direction: [target, predict] counts}.
+        """
+        return {direction: self.confusion[d].copy() for d, direction in enumerate(DIRECTIONS)}
+
+    def per_clip(self):
+        """
+        {clip: {'samples', direction accuracy and per class F1}} of every clip with clip ids.
+        """
+        precision, recall, f1 = precision_recall_f1(self.clip_confusion)
+        direction_accuracy = accuracy(self.clip_confusion)
+        clips = {}
+        for clip, row in self.clips.items():
+            metrics = {'samples': int(self.clip_confusion[row, 0].sum())}
+            for d, direction in enumerate(DIRECTIONS):
+                metrics[f'{direction} accuracy'] = float(direction_accuracy[row, d])
+                for c, name in enumerate(CLASS_NAMES):
+                    metrics[f'{direction} {name} F1'] = float(f1[row, d, c])
+            clips[clip] = metrics
+        return clips
+
+    def threshold_sweep(self):
+        """
+        Precision, recall and F1 of predicting a class whenever its probability is at least
+        the threshold, for thresholds = bin edges. Returns thresholds [num_bins] and
+        {'Go Straight Pass': (precision, recall, f1)} arrays of [num_bins] each.
+        """
+        if not self.has_probs:
+            raise ValueError('threshold sweeps need the stored probabilities, these results only have classes')
+        thresholds = np.arange(self.num_bins) / self.num_bins
+        # samples with probability >= threshold: reversed cumulative sum over bins
+        at_least = np.cumsum(self.histograms[..., ::-1], axis=-1)[..., ::-1].astype(np.float64)
+        tp = at_least[:, :, 1]
+        fp = at_least[:, :, 0]
+        positives = self.histograms[:, :, 1].sum(axis=-1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+            recall = np.where(positives > 0, tp / positives, 0.0)
+            f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+        sweep = {}
+        for d, direction in enumerate(DIRECTIONS):
+            for c, name in enumerate(CLASS_NAMES):
+                sweep[f'{direction} {name}'] = (precision[d, c], recall[d, c], f1[d, c])
+        return thresholds, sweep
+
+
+def _read_text_chunks(path, chunk_size):
+    """
+    Legacy result lines 'name st_predict st_target lf_predict lf_target flag', chunk_size lines at a time.
+    """
+    with open(path, 'r') as f:
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                return
+            fields = np.array(''.join(lines).split(), dtype=object).reshape(len(lines), -1)
+            columns = fields[:, -5:-1].astype(np.int64)
+            yield {'name': fields[:, 0].astype(str), 'st_predict': columns[:, 0], 'st_target': columns[:, 1],
+                   'lf_predict': columns[:, 2], 'lf_target': columns[:, 3]}
+
+
+def _check_unique(seen, index, path):
+    """
+    Mark the sample indices of a part as seen, a boolean array grown as needed, and raise
+    ValueError if one was seen before in the same result directory.
+    """
+    if len(index) == 0:
+        return seen
+    if index.max() >= len(seen):
+        seen = np.concatenate([seen, np.zeros(max(int(index.max()) + 1 - len(seen), len(seen)), dtype=bool)])
+    if seen[index].any() or len(np.unique(index)) != len(index):
+        raise ValueError(f'duplicate sample indices in {path}, it holds the parts of more than one test run')
+    seen[index] = True
+    return seen
+
+
+def _read_npz_chunks(path, chunk_size, seen=None):
+    with np.load(path) as part:
+        columns = {key: part[key] for key in part.files}
+    clip_dirs = columns.pop('clip_dirs', None)
+    if 'index' in columns:
+        seen = _check_unique(np.zeros(0, dtype=bool) if seen is None else seen, columns['index'], path)
+    for start in range(0, len(columns['st_target']), chunk_size):
+        chunk = {key: values[start:start + chunk_size] for key, values in columns.items()}
+        chunk['clip_dirs'] = clip_dirs
+        yield chunk
+    return seen
+
+
+def read_chunks(paths, chunk_size=1000000):
+    """
+    Stream result columns from any mix of result directories (NPZ parts of
+    evaluation.results.ResultWriter), single NPZ parts and legacy text result files.
+    Raises ValueError if a sample index repeats within a directory or part.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        if os.path.isdir(path):
+            seen = np.zeros(0, dtype=bool)
+            for part in sorted(glob.glob(os.path.join(path, 'part-*.npz'))):
+                seen = yield from _read_npz_chunks(part, chunk_size, seen)
+        elif path.endswith('.npz'):
+            yield from _read_npz_chunks(path, chunk_size)
+        else:
+            yield from _read_text_chunks(path, chunk_size)
+
+
+def evaluate(paths, chunk_size=1000000, num_bins=1000):
+    """
+    StreamingMetrics over all results of `paths`, see read_chunks.
+    """
+    metrics = StreamingMetrics(num_bins=num_bins)
+    for chunk in read_chunks(paths, chunk_size):
+        metrics.update_results(chunk)
+    return metrics
@@ -0,0 +1,103 @@
+import glob
+import os
+import socket
+import numpy as np
+
+
+COLUMNS = ('index', 'clip_id', 'name', 'st_prob', 'lf_prob', 'st_target', 'lf_target')
+
+
+class ResultWriter:
+    """
+    Buffered sink of per sample test results, written in bulk as NPZ part files.
+
+    Every column of the added batches is kept in memory and written once `flush_samples`
+    samples are buffered, on flush and on close. Each writer names its parts after the host,
+    process id, rank and a sequence number, and renames a part into place only once it is
+    complete, so any number of processes can write to the same directory at once and
+    readers never see a partial file.
+
+    Columns:
+        index: [N] sample index in the dataset.
+        clip_id: [N] index of the sample's clip folder in clip_dirs.
+        name: [N] first frame name of the window.
+        st_prob, lf_prob: [N, out_class_num] straight and left turn class probabilities.
+        st_target, lf_target: [N] target classes.
+    """
+
+    def __init__(self, out_dir, clip_dirs=(), rank=0, flush_samples=4096):
+        """
+        Args:
+            out_dir (str): Directory the part files are written to, created if missing.
+            clip_dirs (list): Clip folders the clip ids refer to, stored with every part.
+            rank (int): Rank of the writing process, part of the file names.
+            flush_samples (int): Number of buffered samples that triggers a write.
+        """
+        self.out_dir = out_dir
+        self.clip_dirs = np.array([str(clip_dir) for clip_dir in clip_dirs], dtype=str)
+        self.prefix = f'part-{socket.gethostname()}-{os.getpid()}-{rank:03d}'
+        self.flush_samples = flush_samples
+        self.buffer = {column: [] for column in COLUMNS}
+        self.buffered = 0
+        self.parts = 0
+        os.makedirs(out_dir, exist_ok=True)
+
+    def add(self, index, clip_id, name, st_prob, lf_prob, st_target, lf_target):
+        """
+        Buffer a batch of results, array-likes (or tensors) with one entry per sample.
+        """
+        batch = {'index': index, 'clip_id': clip_id, 'name': name, 'st_prob': st_prob,
+                 'lf_prob': lf_prob, 'st_target': st_target, 'lf_target': lf_target}
+        for column, values in batch.items():
+            if hasattr(values, 'detach'):
+                values = values.detach().float().cpu().numpy() if values.is_floating_point() else values.cpu().numpy()
+            self.buffer[column].append(np.asarray(values))
+        self.buffered += len(batch['index'])
+        if self.buffered >= self.flush_samples:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered samples as one part file, returns its path or None if nothing was buffered.
+        """
+        if self.buffered == 0:
+            return None
+        columns = {column: np.concatenate(values) for column, values in self.buffer.items()}
+        columns['name'] = columns['name'].astype(str)
+        path = os.path.join(self.out_dir, f'{self.prefix}-{self.parts:05d}.npz')
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, clip_dirs=self.clip_dirs, **columns)
+        os.replace(path + '.tmp', path)
+        self.buffer = {column: [] for column in COLUMNS}
+        self.buffered = 0
+        self.parts += 1
+        return path
+
+    def close(self):
+        return self.flush()
+
+
+def read_results(out_dir):
+    """
+    Concatenate all part files of a result directory, sorted by sample index.
+    Returns the COLUMNS arrays and clip_dirs. Raises ValueError if a sample index repeats.
+    """
+    paths = sorted(glob.glob(os.path.join(out_dir, 'part-*.npz')))
+    if not paths:
+        raise FileNotFoundError(f'No result parts in {out_dir}')
+    parts = []
+    clip_dirs = None
+    for path in paths:
+        with np.load(path) as part:
+            parts.append({column: part[column] for column in COLUMNS})
+            if clip_dirs is None:
+                clip_dirs = part['clip_dirs']
+    results = {column: np.concatenate([part[column] for part in parts]) for column in COLUMNS}
+    order = np.argsort(results['index'], kind='stable')
+    duplicates = np.flatnonzero(np.diff(results['index'][order]) == 0)
+    if len(duplicates):
+        raise ValueError(f'{len(duplicates)} duplicate sample indices in {out_dir} (e.g. {results["index"][order][duplicates[0]]}), '
+                         f'it holds the parts of more than one test run')
+    results = {column: values[order] for column, values in results.items()}
+    results['clip_dirs'] = clip_dirs
+    return results
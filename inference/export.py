@@ -0,0 +1,54 @@
+import inspect
+import torch
+import torch.nn as nn
+
+
+class ExportableLightFormer(nn.Module):
+    """
+    The full predictor as one traceable module: backbone, encoder and both decoder heads.
+    Takes uint8 windows [B, image_num, 3, h, w] and returns (st_prob, lf_prob), [B, out_class_num] each.
+    """
+
+    def __init__(self, predictor):
+        super().__init__()
+        # Hold the submodules rather than the LightningModule, which cannot be traced outside a Trainer
+        self.model = predictor.model
+        self.class_decoder_st = predictor.class_decoder_st
+        self.class_decoder_lf = predictor.class_decoder_lf
+        self.out_class_num = predictor.config['out_class_num']
+
+    def forward(self, images):
+        head1_out, head2_out = self.model(images)
+        B = head1_out.shape[0]
+        st_prob = self.class_decoder_st(head1_out, None).view(B, self.out_class_num)
+        lf_prob = self.class_decoder_lf(head2_out, None).view(B, self.out_class_num)
+        return st_prob, lf_prob
+
+
+def export_onnx(predictor, path, example, opset_version=17):
+    """
+    Export the predictor to ONNX with a dynamic batch dimension. The window length and
+    frame size are fixed to those of the example input [B, image_num, 3, h, w].
+    """
+    module = ExportableLightFormer(predictor).eval()
+    kwargs = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        # The encoder unrolls over the window, which the TorchScript based exporter traces as is
+        kwargs['dynamo'] = False
+    # Exported with autograd enabled, under no_grad nn.MultiheadAttention takes its fused
+    # fast path, which has no ONNX symbolic
+    torch.onnx.export(module, (example,), path,
+                      input_names=['images'], output_names=['st_prob', 'lf_prob'],
+                      dynamic_axes={'images': {0: 'batch'}, 'st_prob': {0: 'batch'}, 'lf_prob': {0: 'batch'}},
+                      opset_version=opset_version, **kwargs)
+
+
+def export_torchscript(predictor, path, example):
+    """
+    Trace the predictor to a TorchScript module, loadable with torch.jit.load and no repo code.
+    """
+    module = ExportableLightFormer(predictor).eval()
+    with torch.no_grad():
+        traced = torch.jit.trace(module, (example,))
+    traced.save(path)
+    return traced
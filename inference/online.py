@@ -0,0 +1,66 @@
+import collections
+import torch
+
+
+class OnlineLightFormer:
+    """
+    Online inference on a live camera feed, one new frame per call.
+
+    Consecutive windows share image_num - 1 frames, so the backbone and down_conv features
+    of every frame are kept in a ring buffer and each step runs the backbone on the new
+    frame only. The encoder, MLP heads and decoders still see the whole window, which
+    gives the same decision as LightFormerPredictor on the last image_num frames.
+
+    With recurrent=True the encoder state is carried from frame to frame instead
+    (LightFormer.step), so each step is O(1) in the window length as well, at the cost
+    of no longer matching the fixed window the model was trained on.
+    """
+
+    def __init__(self, predictor, recurrent=False):
+        """
+        Args:
+            predictor (LightFormerPredictor): Trained predictor, switched to eval mode.
+            recurrent (bool): Carry the encoder state across frames instead of replaying the window.
+        """
+        self.predictor = predictor.eval()
+        self.model = predictor.model
+        self.image_num = predictor.config['image_num']
+        self.recurrent = recurrent
+        self.features = collections.deque(maxlen=self.image_num)
+        self.state = None
+
+    @property
+    def device(self):
+        return self.model.pixel_mean.device
+
+    def reset(self):
+        """
+        Forget all buffered frames, e.g. when the camera feed restarts.
+        """
+        self.features.clear()
+        self.state = None
+
+    @torch.no_grad()
+    def step(self, frame):
+        """
+        Args:
+            frame: [3, h, w] newest frame at config['image_size'], uint8 or already normalized float
+        Returns:
+            st_prob, lf_prob: [out_class_num] probabilities of the straight and left turn heads
+        """
+        frame = frame.to(self.device)[None]
+        if self.recurrent:
+            if self.state is None:
+                self.state = self.model.initial_state(1)
+            head1_out, head2_out, self.state = self.model.step(frame, self.state)
+            st_prob, lf_prob = self.predictor.decode_probs(head1_out, head2_out)
+            return st_prob[0], lf_prob[0]
+
+        self.features.append(self.model.encode_frames(frame)[0])
+
+        # Until the buffer is full the window is shorter, which matches a padded window with its length masked
+        vectors = torch.stack(list(self.features))[None] # [1, num_valid, 256, h, w]
+
+        head1_out, head2_out = self.model.forward_features(vectors)
+        st_prob, lf_prob = self.predictor.decode_probs(head1_out, head2_out)
+        return st_prob[0], lf_prob[0]
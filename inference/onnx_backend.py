@@ -0,0 +1,31 @@
+import numpy as np
+import torch
+
+
+class OnnxLightFormer:
+    """
+    CPU inference of an exported predictor (inference/export.py) under ONNX Runtime, with the
+    same predict_probs interface as LightFormerPredictor so it can back the inference server.
+    """
+
+    def __init__(self, path, threads=None):
+        """
+        Args:
+            path (str): ONNX file written by tools/export_model.py.
+            threads (int): ONNX Runtime intra op threads, its default if not given.
+        """
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if threads is not None:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+    def predict_probs(self, images):
+        """
+        images: uint8 windows [B, image_num, 3, h, w], torch tensor or numpy array
+        returns: st_prob, lf_prob torch tensors [B, out_class_num]
+        """
+        if isinstance(images, torch.Tensor):
+            images = images.numpy()
+        st_prob, lf_prob = self.session.run(None, {'images': np.ascontiguousarray(images, dtype=np.uint8)})
+        return torch.from_numpy(st_prob), torch.from_numpy(lf_prob)
@@ -0,0 +1,77 @@
+import copy
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+
+class NormalizedLinear(nn.Module):
+    """
+    Inference form of MultiArcFace (label=None): cosine similarity to the class centres as an
+    nn.Linear with the centres normalized ahead of time, which dynamic quantization can replace.
+    """
+
+    def __init__(self, arcface):
+        super().__init__()
+        self.in_features = arcface.in_features
+        self.linear = nn.Linear(arcface.in_features, arcface.out_features, bias=False)
+        with torch.no_grad():
+            self.linear.weight.copy_(F.normalize(arcface.weight))
+
+    def forward(self, input, label=None):
+        if label is not None:
+            raise ValueError("NormalizedLinear only supports inference, label must be None")
+        input = input.reshape(input.shape[0], self.in_features)
+        return self.linear(F.normalize(input))
+
+
+def default_backend():
+    """
+    Quantized kernel backend of this machine, x86 (fbgemm) or qnnpack on ARM.
+    """
+    engines = torch.backends.quantized.supported_engines
+    for backend in ['x86', 'fbgemm', 'qnnpack']:
+        if backend in engines:
+            return backend
+    raise RuntimeError(f"no quantized backend available, supported engines: {engines}")
+
+
+def quantize_predictor(predictor, calibration, backend=None, frame_size=(512, 960)):
+    """
+    INT8 copy of a LightFormerPredictor for CPU inference.
+
+    The backbone and down_conv are quantized statically as one graph (FX mode), with activation
+    ranges observed on the calibration windows. The MLP heads and both MultiArcFace decoders
+    are quantized dynamically. The encoder's deformable attention stays in float32.
+
+    Args:
+        predictor (LightFormerPredictor): Trained float predictor, left unchanged.
+        calibration (iterable): uint8 windows [B, image_num, 3, h, w] to calibrate on.
+        backend (str): Quantized backend, default_backend() if not given.
+        frame_size (tuple): Frame height and width.
+    """
+    backend = backend or default_backend()
+    torch.backends.quantized.engine = backend
+    predictor = copy.deepcopy(predictor).eval()
+    model = predictor.model
+
+    trunk = nn.Sequential(model.backbone, model.down_conv)
+    example = (torch.randn(1, 3, *frame_size),)
+    prepared = prepare_fx(trunk, get_default_qconfig_mapping(backend), example)
+
+    # encode_frames runs the backbone then down_conv, so the observed trunk takes the backbone's place
+    model.backbone = prepared
+    model.down_conv = nn.Identity()
+    with torch.no_grad():
+        for images in calibration:
+            model(images)
+    model.backbone = convert_fx(prepared)
+
+    for decoder in [predictor.class_decoder_st, predictor.class_decoder_lf]:
+        decoder.mul_arcface = NormalizedLinear(decoder.mul_arcface)
+    for name in ['mlp', 'head1', 'head2']:
+        setattr(model, name, quantize_dynamic(getattr(model, name), {nn.Linear}, dtype=torch.qint8))
+    predictor.class_decoder_st = quantize_dynamic(predictor.class_decoder_st, {nn.Linear}, dtype=torch.qint8)
+    predictor.class_decoder_lf = quantize_dynamic(predictor.class_decoder_lf, {nn.Linear}, dtype=torch.qint8)
+    return predictor
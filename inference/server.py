@@ -0,0 +1,191 @@
+import asyncio
+import collections
+import json
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import torch
+
+
+# Wire format, both directions: 4 byte big endian header length, JSON header, then
+# header['nbytes'] bytes of payload (a uint8 window of header['shape'] for requests).
+
+async def read_message(reader):
+    (length,) = struct.unpack('>I', await reader.readexactly(4))
+    header = json.loads(await reader.readexactly(length))
+    payload = await reader.readexactly(header.get('nbytes', 0))
+    return header, payload
+
+
+def write_message(writer, header, payload=b''):
+    header = dict(header, nbytes=len(payload))
+    data = json.dumps(header).encode('utf-8')
+    writer.write(struct.pack('>I', len(data)) + data + payload)
+
+
+def latency_summary(latencies):
+    """
+    Count, mean, p50 and p99 in milliseconds of a sequence of latencies in seconds.
+    """
+    if len(latencies) == 0:
+        return {'count': 0}
+    ms = np.asarray(latencies) * 1000
+    return {
+        'count': len(ms),
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p99_ms': float(np.percentile(ms, 99)),
+    }
+
+
+class MicroBatcher:
+    """
+    Collect windows from many camera streams into micro batches.
+
+    A batch runs as soon as it holds max_batch requests or its oldest request has waited
+    max_wait_ms, whichever comes first. Inference runs on a worker thread so the event
+    loop keeps accepting requests while a batch is being computed.
+    """
+
+    def __init__(self, predict, max_batch=8, max_wait_ms=10.0, window=10000):
+        """
+        Args:
+            predict (callable): Maps uint8 windows [B, image_num, 3, h, w] to (st_prob, lf_prob), [B, 2] each.
+            max_batch (int): Largest micro batch.
+            max_wait_ms (float): Latency deadline for filling a batch.
+            window (int): Number of recent requests the latency metrics are computed over.
+        """
+        self.predict = predict
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+        self.task = None
+        self.latencies = collections.deque(maxlen=window)
+        self.batch_sizes = collections.deque(maxlen=window)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def start(self):
+        """
+        Start batching on the running event loop.
+        """
+        self.queue = asyncio.Queue()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def submit(self, images):
+        """
+        Queue one window [image_num, 3, h, w] and wait for its probabilities.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((images, future, time.perf_counter()))
+        return await future
+
+    async def next_batch(self):
+        batch = [await self.queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch:
+            if not self.queue.empty():
+                # Requests that queued up behind the previous batch go in without waiting
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.next_batch()
+            images = torch.stack([request[0] for request in batch])
+            try:
+                st_prob, lf_prob = await loop.run_in_executor(self.executor, self.predict, images)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            done = time.perf_counter()
+            self.batch_sizes.append(len(batch))
+            for i, (_, future, start) in enumerate(batch):
+                self.latencies.append(done - start)
+                if not future.done():
+                    future.set_result((st_prob[i].tolist(), lf_prob[i].tolist()))
+
+    def stats(self):
+        stats = latency_summary(self.latencies)
+        stats['mean_batch'] = float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0
+        return stats
+
+
+class InferenceServer:
+    """
+    Local inference server for many concurrent camera streams.
+
+    Each connection sends requests {'op': 'predict', 'stream': id, 'shape': [...]} with a
+    uint8 window as payload and receives {'st_prob', 'lf_prob', 'latency_ms'}, or {'error'}
+    when its micro batch failed, keeping the connection open. {'op': 'stats'} returns the
+    p50/p99 latency of recent requests.
+    """
+
+    def __init__(self, predict, shape, max_batch=8, max_wait_ms=10.0):
+        """
+        Args:
+            predict (callable): See MicroBatcher.
+            shape (tuple): Accepted window shape (image_num, 3, h, w).
+        """
+        self.shape = list(shape)
+        self.nbytes = int(np.prod(shape))
+        self.batcher = MicroBatcher(predict, max_batch, max_wait_ms)
+        self.streams = set()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    header, payload = await read_message(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                if header.get('op') == 'stats':
+                    write_message(writer, dict(self.batcher.stats(), streams=len(self.streams)))
+                elif header.get('op') == 'predict':
+                    if header.get('shape') != self.shape or len(payload) != self.nbytes:
+                        write_message(writer, {'error': f"expected a uint8 window of shape {self.shape}"})
+                    else:
+                        self.streams.add(header.get('stream'))
+                        start = time.perf_counter()
+                        images = torch.frombuffer(bytearray(payload), dtype=torch.uint8).view(self.shape)
+                        try:
+                            st_prob, lf_prob = await self.batcher.submit(images)
+                        except Exception as e:
+                            # A failed micro batch fails its requests, not their connections
+                            write_message(writer, {'stream': header.get('stream'), 'error': str(e)})
+                        else:
+                            write_message(writer, {'stream': header.get('stream'), 'st_prob': st_prob, 'lf_prob': lf_prob,
+                                                   'latency_ms': (time.perf_counter() - start) * 1000})
+                else:
+                    write_message(writer, {'error': f"unknown op {header.get('op')}"})
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def report(self, every):
+        while True:
+            await asyncio.sleep(every)
+            stats = self.batcher.stats()
+            if stats['count']:
+                print(f"[{len(self.streams)} streams] p50 {stats['p50_ms']:.1f} ms, p99 {stats['p99_ms']:.1f} ms, "
+                      f"mean batch {stats['mean_batch']:.2f}", flush=True)
+
+    async def start(self, socket_path=None, port=None):
+        """
+        Listen on a Unix socket, or on localhost:port when no socket path is given.
+        """
+        self.batcher.start()
+        if socket_path is not None:
+            return await asyncio.start_unix_server(self.handle, path=socket_path)
+        return await asyncio.start_server(self.handle, host='127.0.0.1', port=port)
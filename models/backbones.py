@@ -0,0 +1,102 @@
+import torch
+import torch.nn as nn
+from torchvision import models
+from torchvision.models.resnet import BasicBlock
+
+
+class ResNetTrunk(nn.Module):
+    """
+    ResNet-18 without the last two layers (average pooling and fully connected), as a plain
+    module so it can be traced and exported. Parameter names match torchvision's resnet18.
+
+    width < 1 scales the channels of every stage (64, 128, 256, 512), for which there are no
+    ImageNet weights.
+    """
+
+    def __init__(self, width=1.0, imagenet=False):
+        super().__init__()
+        resnet = models.resnet18(weights='IMAGENET1K_V1' if imagenet else None)
+        if width != 1.0:
+            planes = [max(8, int(round(c * width / 8)) * 8) for c in [64, 128, 256, 512]]
+            resnet.inplanes = planes[0]
+            resnet.conv1 = nn.Conv2d(3, planes[0], kernel_size=7, stride=2, padding=3, bias=False)
+            resnet.bn1 = nn.BatchNorm2d(planes[0])
+            resnet.layer1 = resnet._make_layer(BasicBlock, planes[0], 2)
+            resnet.layer2 = resnet._make_layer(BasicBlock, planes[1], 2, stride=2)
+            resnet.layer3 = resnet._make_layer(BasicBlock, planes[2], 2, stride=2)
+            resnet.layer4 = resnet._make_layer(BasicBlock, planes[3], 2, stride=2)
+        self.conv1 = resnet.conv1
+        self.bn1 = resnet.bn1
+        self.relu = resnet.relu
+        self.maxpool = resnet.maxpool
+        self.layer1 = resnet.layer1
+        self.layer2 = resnet.layer2
+        self.layer3 = resnet.layer3
+        self.layer4 = resnet.layer4
+        self.out_channels = self.layer4[-1].conv2.out_channels
+
+    def forward(self, x):
+        x = self.conv1(x)
+        x = self.bn1(x)
+        x = self.relu(x)
+        x = self.maxpool(x)
+        x = self.layer1(x)
+        x = self.layer2(x)
+        x = self.layer3(x) # C: 256
+        x = self.layer4(x) # C: 512
+        return x
+
+
+class FeaturesTrunk(nn.Module):
+    """
+    The `features` stage of a torchvision classifier (MobileNetV3, EfficientNet), stride 32
+    like the ResNet trunk. Parameter names match torchvision's `features.*`.
+    """
+
+    def __init__(self, arch, imagenet=False):
+        super().__init__()
+        self.features = getattr(models, arch)(weights='DEFAULT' if imagenet else None).features
+        with torch.no_grad():
+            self.out_channels = self.features(torch.zeros(1, 3, 64, 64)).shape[1]
+
+    def forward(self, x):
+        return self.features(x)
+
+
+# name: (constructor, whether torchvision has ImageNet weights for it)
+BACKBONES = {
+    'resnet18': (lambda imagenet: ResNetTrunk(1.0, imagenet), True),
+    'resnet18_w075': (lambda imagenet: ResNetTrunk(0.75), False),
+    'resnet18_w050': (lambda imagenet: ResNetTrunk(0.5), False),
+    'mobilenet_v3_small': (lambda imagenet: FeaturesTrunk('mobilenet_v3_small', imagenet), True),
+    'mobilenet_v3_large': (lambda imagenet: FeaturesTrunk('mobilenet_v3_large', imagenet), True),
+    'efficientnet_b0': (lambda imagenet: FeaturesTrunk('efficientnet_b0', imagenet), True),
+}
+
+
+def build_backbone(name='resnet18', weights='imagenet'):
+    """
+    Build a backbone of BACKBONES, exposing `out_channels` of its stride 32 feature map.
+
+    Args:
+        name (str): Key of BACKBONES.
+        weights (str): 'imagenet' for torchvision's ImageNet weights (downloaded on first use),
+            a local file with a torchvision classifier or backbone state dict, or None for
+            random initialization.
+    """
+    if name not in BACKBONES:
+        raise ValueError(f"unknown backbone {name}, expected one of {sorted(BACKBONES)}")
+    build, has_imagenet = BACKBONES[name]
+    if weights == 'imagenet':
+        if not has_imagenet:
+            raise ValueError(f"there are no ImageNet weights for backbone {name}, pass a local weights file or None")
+        return build(True)
+
+    backbone = build(False)
+    if weights is not None:
+        state_dict = torch.load(weights, map_location='cpu')
+        state_dict = state_dict.get('state_dict', state_dict)
+        # The classifier head of a torchvision checkpoint is not part of the backbone
+        state_dict = {k: v for k, v in state_dict.items() if not k.startswith(('fc.', 'classifier.'))}
+        backbone.load_state_dict(state_dict)
+    return backbone
@@ -13,9 +13,11 @@ class Decoder(nn.Module):
 
     def forward(self, agent_all_feature, label=None):
         B, K, _,_ = agent_all_feature.shape
-        prob = self.mul_arcface(agent_all_feature,label)
-        prob = prob.view(B, self.config['n'], self.config['out_class_num'], 1)
-        res, idx = torch.max(prob, dim=1)
-        # res = torch.mean(prob, dim=1)
-        res = F.softmax(res, dim=1)
+        # The ArcFace normalization and the softmax stay in fp32 under mixed precision
+        with torch.autocast('cuda' if agent_all_feature.is_cuda else 'cpu', enabled=False):
+            prob = self.mul_arcface(agent_all_feature.float(),label)
+            prob = prob.view(B, self.config['n'], self.config['out_class_num'], 1)
+            res, idx = torch.max(prob, dim=1)
+            # res = torch.mean(prob, dim=1)
+            res = F.softmax(res, dim=1)
         return res
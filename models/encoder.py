@@ -2,6 +2,7 @@ import torch
 import torch.nn as nn
 from .spatial_cross_attention import sca
 from .temporal_self_attention import tsa
+from .profiler import StageTimer
 
 class Encoder(nn.Module):
     def __init__(self, config):
@@ -18,33 +19,64 @@ class Encoder(nn.Module):
             nn.Linear(self.embed_dim, self.embed_dim)
         )
         self.norm = nn.LayerNorm(self.embed_dim)
-        self.prev_embed = None
+        # Shared with LightFormer, times the tsa and sca stages
+        self.timer = StageTimer()
 
 
-    def forward(self, query, all_img_feats):
-        bs, _, _, h, w = all_img_feats.shape
-        ref_2d = self.get_reference_points(h, w, bs, self.config['training']['accelerator'])
+    def forward(self, query, all_img_feats, lengths=None):
+        """
+        query: [num_query, embed_dim]
+        all_img_feats: [bs, num_imgs, 256, h, w]
+        lengths: [bs] number of valid leading frames of each sample, the padded frames after them
+                 leave the state unchanged; all frames are valid if not given
+        """
+        bs, num_imgs = all_img_feats.shape[:2]
         query = query.unsqueeze(0).repeat(bs, 1, 1)
-        all_feats = all_img_feats.flatten(3).permute(0,1,3,2)  # [8,10,120,256]
-        _,num_imgs,resolu,_ = all_feats.shape
+        state = self.initial_state(query)
         output = None
 
         for i in range(num_imgs):
-            single_feat = all_feats[:, i, :, :].view(bs, resolu, self.num_heads, -1)
-            output = self.tsa(query, self.prev_embed)
-            output = self.sca(output, single_feat, ref_2d, h, w)
-            output = output.mean(1).unsqueeze(1)
-            output = self.mlp(output) + output
-            output = self.norm(output)
-            # output = output.relu()
-            self.prev_embed = output
-            # self.prev_embed = None # 消融实验
-
-        self.prev_embed = None
+            valid = None if lengths is None else lengths > i
+            output, state = self.step(query, all_img_feats[:, i], state, valid)
+            # state = self.initial_state(query) # 消融实验
 
         return output
 
-    def get_reference_points(self, H=4, W=11, bs=8, device='cuda'):
+    def initial_state(self, query):
+        """
+        State before the first frame: the temporal attention attends to the query itself.
+        query: [bs, num_query, embed_dim]
+        """
+        return query
+
+    def step(self, query, frame_feat, state, valid=None):
+        """
+        Advance the temporal state by one frame. The module keeps no state of its own, so any
+        number of streams can be stepped concurrently or stacked along the batch dimension.
+
+        query: [bs, num_query, embed_dim]
+        frame_feat: [bs, 256, h, w] features of the newest frame
+        state: [bs, num_query, embed_dim] state returned by the previous step or initial_state
+        valid: [bs] bool, samples whose frame is padding keep their state; all valid if not given
+        returns: output [bs, 1, embed_dim] and the new state
+        """
+        bs, _, h, w = frame_feat.shape
+        ref_2d = self.get_reference_points(h, w, bs, frame_feat.device)
+        single_feat = frame_feat.flatten(2).permute(0, 2, 1).reshape(bs, h*w, self.num_heads, -1)  # [8,120,8,32]
+        with self.timer.stage('tsa', frame_feat.device):
+            output = self.tsa(query, state)
+        with self.timer.stage('sca', frame_feat.device):
+            output = self.sca(output, single_feat, ref_2d, h, w)
+        output = output.mean(1).unsqueeze(1)
+        output = self.mlp(output) + output
+        output = self.norm(output)
+        # output = output.relu()
+        if valid is not None:
+            output = torch.where(valid[:, None, None], output, state)
+        return output, output
+
+    @staticmethod
+    def get_reference_points(H=4, W=11, bs=8, device='cuda'):
         ref_y, ref_x = torch.meshgrid(torch.linspace(0.5, H - 0.5, H, dtype=torch.float, device=device), torch.linspace(0.5, W - 0.5, W, dtype=torch.float, device=device))
         ref_y = ref_y.reshape(-1)[None] / H
         ref_x = ref_x.reshape(-1)[None] / W
@@ -1,30 +1,31 @@
 import sys
+import os
+import time
+import numpy as np
 sys.path.append('.')
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
-from torchvision import models, transforms
-from torch.utils.data import DataLoader
+import torch.utils.checkpoint
+import torch.distributed as dist
+from torch.utils.data import DataLoader, Subset
 from .encoder import Encoder
 from .decoder import Decoder
+from .backbones import build_backbone
+from .necks import build_neck, neck_latency_ms
+from .profiler import StageTimer
 import pytorch_lightning as pl
+from analysis import direction_precision_recall_f1
 from dataset.dataset import LightFormerDataset
-from pathlib import Path
-from functools import partial
+from dataset.frame_cache import SharedFrameCache
+from dataset.frame_store import FrameStore
+from dataset.feature_store import FeatureStore
+from dataset.sampler import ShardSampler
+from evaluation.results import ResultWriter
+from evaluation.cache import EvalCache, model_key
 
 
-def _resnet_forward(self, x):
-    x = self.conv1(x)
-    x = self.bn1(x)
-    x = self.relu(x)
-    x = self.maxpool(x)
-    x = self.layer1(x)
-    x = self.layer2(x)
-    x = self.layer3(x) # C: 256
-    x = self.layer4(x) # C: 512
-    return x
-
 class LightFormer(nn.Module):
 
 
@@ -32,22 +33,14 @@ class LightFormer(nn.Module):
         super().__init__()
         self.config = config
 
-        # Remove last two layers: Average Pooling and Fully Connected
-        self.resnet = models.resnet18(pretrained=True)
-        self.resnet.fc = None
-        self.resnet.avgpool = None
-
-        # Adjust resnet forward to reflect removed last two layers
-        self.resnet.forward = partial(_resnet_forward, self.resnet)
-
+        # Backbone with the classification layers removed (Average Pooling and Fully Connected), resnet18 by default
+        backbone = self.config.get('backbone', {})
+        self.backbone = build_backbone(backbone.get('name', 'resnet18'), backbone.get('weights', 'imagenet'))
+        # Checkpoints from before the backbone registry name the backbone `resnet`
+        self._register_load_state_dict_pre_hook(self._rename_resnet_keys)
 
-        self.down_conv = nn.Sequential(
-            nn.Conv2d(512, 1024, 3),
-            nn.BatchNorm2d(1024),
-            nn.ReLU(),
-            nn.Conv2d(1024, 256, 3),
-            nn.BatchNorm2d(256)
-        )
+        # Neck mapping backbone features to the 256 channels of the encoder, kept under its original name
+        self.down_conv = build_neck(self.config.get('neck', 'conv'), self.backbone.out_channels, 256)
         self.mlp = nn.Sequential(
             nn.Linear(256,512),
             nn.ReLU(),
@@ -72,43 +65,170 @@ class LightFormer(nn.Module):
         # Encoder
         self.encoder = Encoder(self.config)
 
+        # Per stage wall time and memory of the forward pass, see StageTimer
+        self.timer = StageTimer(self.config.get('profile', False))
+        self.encoder.timer = self.timer
 
-    def forward(self, images, features=None):
+        # ImageNet statistics in uint8 pixel units, so scaling and normalization are a single op
+        image_norm = [(0.485, 0.456, 0.406), (0.229, 0.224, 0.225)]
+        self.register_buffer('pixel_mean', torch.tensor(image_norm[0]).view(3, 1, 1) * 255.0, persistent=False)
+        self.register_buffer('pixel_std', torch.tensor(image_norm[1]).view(3, 1, 1) * 255.0, persistent=False)
+
+        self.backbone_frozen = False
+
+        # Peak memory options of the per frame encoder, see encode_frames
+        self.checkpoint_backbone = self.config.get('training', {}).get('checkpoint_backbone', False)
+        self.backbone_chunk_size = self.config.get('training', {}).get('backbone_chunk_size', 0)
+
+    @staticmethod
+    def _rename_resnet_keys(state_dict, prefix, *args):
+        for key in [k for k in state_dict if k.startswith(prefix + 'resnet.')]:
+            state_dict[prefix + 'backbone.' + key[len(prefix + 'resnet.'):]] = state_dict.pop(key)
+
+    def freeze_backbone(self):
         """
-        images: self.config['image_num'] number of buffered sequential images (default 10)
+        Stop training the backbone and down_conv: no gradients, and their batch norm statistics
+        stay fixed in train mode, so their outputs can be precomputed (see FeatureStore).
         """
-        image_num = self.config['image_num']
-        B,_,c,h,w = images.shape
-
-        # Reshape Image Buffer to accommodate Resnet input shape
-        images = images.reshape(B*image_num,c,h,w)
+        self.backbone_frozen = True
+        self.backbone.requires_grad_(False)
+        self.down_conv.requires_grad_(False)
+        return self.train(self.training)
+
+    def train(self, mode=True):
+        super().train(mode)
+        if self.backbone_frozen:
+            self.backbone.eval()
+            self.down_conv.eval()
+        return self
+
+    def normalize(self, images):
+        """
+        Scale uint8 frames [..., 3, h, w] to [0, 1] and apply the ImageNet normalization.
+        """
+        return (images.float() - self.pixel_mean) / self.pixel_std
 
-        # Modified Resnet Backbone
-        vectors = self.resnet(images)
+    def encode_frames(self, images):
+        """
+        images: [N, 3, h, w] independent frames, uint8 frames are normalized here
+        returns: [N, 256, h', w'] per frame features
+
+        When training with gradients, training.backbone_chunk_size sends the frames through
+        the backbone that many at a time, and with training.checkpoint_backbone the activations
+        of each chunk are recomputed in the backward pass instead of being kept, so together
+        they bound the training activation memory by one chunk instead of batch_size x
+        image_num frames, at the cost of a second backbone forward. Batch norm then normalizes
+        each chunk with its own batch statistics, and checkpointing updates the running
+        statistics in both forward passes. Evaluation, inference and tracing run all frames at
+        once, so exported graphs keep a dynamic batch size.
+        """
+        grad_training = self.training and torch.is_grad_enabled()
+        checkpoint = self.checkpoint_backbone and grad_training and not self.backbone_frozen
+        chunk = grad_training and 0 < self.backbone_chunk_size < len(images)
+        if not checkpoint and not chunk:
+            return self._encode_chunk(images)
+
+        chunks = []
+        for frames in images.split(self.backbone_chunk_size if chunk else len(images)):
+            if checkpoint:
+                chunks.append(torch.utils.checkpoint.checkpoint(self._encode_chunk, frames, use_reentrant=False))
+            else:
+                chunks.append(self._encode_chunk(frames))
+        return torch.cat(chunks)
+
+    def _encode_chunk(self, images):
+        if images.dtype == torch.uint8:
+            images = self.normalize(images)
+
+        # Backbone without the classification layers
+        with self.timer.stage('backbone', images.device):
+            vectors = self.backbone(images)
 
         # Down convolution encoding
-        vectors = self.down_conv(vectors) # 512 -> 256
-
-        # Reshape back to batch, image number structure
-        _,c,h,w = vectors.shape
-        vectors = vectors.view(B, image_num, c, h, w) # [bs,num_img, 256, h, w]
+        with self.timer.stage('down_conv', images.device):
+            return self.down_conv(vectors) # backbone.out_channels -> 256
 
+    def forward_features(self, vectors, lengths=None):
+        """
+        vectors: [bs, num_img, 256, h, w] per frame features from encode_frames
+        lengths: [bs] valid leading frames of each window, all frames if not given
+        """
         # Grab query embedding
         query = self.query_embed.weight
 
         # Run encoder architecture
-        agent_all_feature = self.encoder(query, vectors) # [bs, 1, 256]
+        agent_all_feature = self.encoder(query, vectors, lengths) # [bs, 1, 256]
 
-        # Run simple multilayer perceptrons
-        agent_all_feature = self.mlp(agent_all_feature)
+        return self.heads(agent_all_feature)
 
-        # two headed outputs for use in straight and left decoders
-        head1_out = self.head1(agent_all_feature)
-        head2_out = self.head2(agent_all_feature)
+    def heads(self, agent_all_feature):
+        """
+        agent_all_feature: [bs, 1, 256] encoder output
+        """
+        with self.timer.stage('heads', agent_all_feature.device):
+            # Run simple multilayer perceptrons
+            agent_all_feature = self.mlp(agent_all_feature)
+
+            # two headed outputs for use in straight and left decoders
+            head1_out = self.head1(agent_all_feature)
+            head2_out = self.head2(agent_all_feature)
         head1_out = head1_out.unsqueeze(3)
         head2_out = head2_out.unsqueeze(3)
         return head1_out, head2_out
 
+    def initial_state(self, num_streams):
+        """
+        Encoder state of num_streams new streams, [num_streams, num_query, embed_dim].
+        """
+        query = self.query_embed.weight.unsqueeze(0).repeat(num_streams, 1, 1)
+        return self.encoder.initial_state(query)
+
+    def step(self, images, state):
+        """
+        Recurrent inference, one new frame for each of S streams. The model holds no stream
+        state, callers keep it and may stack the states of any streams into one batch.
+        Unlike forward, the temporal state is never reset to a fixed window.
+
+        images: [S, 3, h, w] newest frame of each stream
+        state: [S, num_query, embed_dim] state from the previous step or initial_state
+        returns: head1_out, head2_out and the new state
+        """
+        vectors = self.encode_frames(images)
+        query = self.query_embed.weight.unsqueeze(0).repeat(len(images), 1, 1)
+        agent_all_feature, state = self.encoder.step(query, vectors, state)
+        head1_out, head2_out = self.heads(agent_all_feature)
+        return head1_out, head2_out, state
+
+    def forward(self, images, features=None, lengths=None):
+        """
+        images: [bs, num_img, 3, h, w] buffered sequential images (config['image_num'], default 10),
+                uint8 frames are normalized here, float frames are expected to be normalized already
+        features: [bs, num_img, 256, h, w] precomputed encode_frames output, used instead of images when given
+        lengths: [bs] valid leading frames of each window, the padded frames after them are skipped
+                 by the backbone and masked in the encoder; all frames are valid if not given
+        """
+        if features is not None:
+            return self.forward_features(features.float(), lengths)
+
+        B,image_num,c,h,w = images.shape
+        images = images.reshape(B*image_num,c,h,w)
+
+        if lengths is None or bool((lengths >= image_num).all()):
+            # Reshape Image Buffer to accommodate Resnet input shape
+            vectors = self.encode_frames(images)
+        else:
+            # Run the backbone on the valid frames only, padded frames get zero features
+            valid = (torch.arange(image_num, device=lengths.device)[None] < lengths[:, None]).flatten()
+            encoded = self.encode_frames(images[valid])
+            vectors = encoded.new_zeros((B*image_num, *encoded.shape[1:]))
+            vectors[valid] = encoded
+
+        # Reshape back to batch, image number structure
+        _,c,h,w = vectors.shape
+        vectors = vectors.view(B, image_num, c, h, w) # [bs,num_img, 256, h, w]
+
+        return self.forward_features(vectors, lengths)
+
 
 class LightFormerPredictor(pl.LightningModule, nn.Module):
 
@@ -122,39 +242,265 @@ class LightFormerPredictor(pl.LightningModule, nn.Module):
         self.class_decoder_st = Decoder(self.config)
         self.class_decoder_lf = Decoder(self.config)
 
+        # Decoded frame cache shared by all dataloader workers and preprocessed frame store, built on first use
+        self._frame_cache = None
+        self._frame_store = None
+        self._feature_store = None
+        # Buffered per sample test results and the directory of the last test run, see on_test_epoch_start
+        self._result_writer = None
+        self.test_result_dir = None
+        # Neck parameters and latency, measured on first use, see neck_stats
+        self._neck_stats = None
+        # Cached test predictions of the current weights, see test_dataset
+        self._eval_cache = None
+        self._model_key = None
+        self._test_sample_keys = None
+        self._test_cache_hits = None
+        self._test_cache_pending = []
+
+        if self.config['training'].get('freeze_backbone', False):
+            self.model.freeze_backbone()
+        if self.feature_store() is not None:
+            if not self.model.backbone_frozen:
+                raise ValueError("data.feature_store holds features of a fixed backbone, set training.freeze_backbone")
+            # Keep the checkpoint consistent with the stored features
+            self.model.load_state_dict(self.feature_store().backbone_state_dict(), strict=False)
+
+    def frame_cache(self):
+        """
+        Return the shared frame cache, or None when config['data']['frame_cache_mb'] is unset.
+        """
+        cache_mb = self.config.get('data', {}).get('frame_cache_mb', 0)
+        if self._frame_cache is None and cache_mb:
+            self._frame_cache = SharedFrameCache.from_megabytes(cache_mb, (3, *self.image_size()), torch.uint8)
+        return self._frame_cache
+
+    def image_size(self):
+        return tuple(self.config.get('image_size', (512, 960)))
+
+    def decode_backend(self):
+        return self.config.get('data', {}).get('decode_backend', 'skimage')
+
+    def frame_store(self):
+        """
+        Return the preprocessed frame store, or None when config['data']['frame_store'] is unset.
+        """
+        store_dir = self.config.get('data', {}).get('frame_store')
+        if self._frame_store is None and store_dir:
+            self._frame_store = FrameStore(store_dir)
+        return self._frame_store
+
+    def feature_store(self):
+        """
+        Return the frozen backbone feature store, or None when config['data']['feature_store'] is unset.
+        """
+        store_dir = self.config.get('data', {}).get('feature_store')
+        if self._feature_store is None and store_dir:
+            self._feature_store = FeatureStore(store_dir)
+        return self._feature_store
+
+    def eval_cache(self):
+        """
+        Return the test prediction cache, or None when config['test']['eval_cache'] is unset.
+        """
+        path = self.config['test'].get('eval_cache')
+        if self._eval_cache is None and path:
+            self._eval_cache = EvalCache(path, self.config['test'].get('eval_cache_mb', 1024))
+        return self._eval_cache
+
+    def test_precision(self):
+        """
+        Numeric precision test predictions run in: the trainer's, 32-true outside of a trainer (eval.py).
+        """
+        return str(self._trainer.precision) if self._trainer is not None else '32-true'
+
+    def test_dataset(self, samples=None, min_samples=0, cache_keys=None):
+        """
+        The test set. With an eval cache, only the samples without cached predictions for the
+        current weights, precision and frames, at least min_samples of them; the cached ones
+        are kept for cached_test_results. Given `samples`, the dataset indices of a previous
+        lookup, only those, without a lookup; and given its `cache_keys`, without hashing again.
+        """
+        test_set = LightFormerDataset(self.config['test']['sample_database_folder'],
+                                      frame_cache=self.frame_cache(), frame_store=self.frame_store(),
+                                      decode_backend=self.decode_backend(), feature_store=self.feature_store(),
+                                      image_num=self.config['image_num'], image_size=self.image_size())
+        cache = self.eval_cache()
+        if cache is None:
+            return test_set if samples is None else Subset(test_set, samples)
+
+        if cache_keys is not None:
+            self._model_key, self._test_sample_keys = cache_keys
+        else:
+            self._model_key = model_key(self, self.config, self.test_precision())
+            self._test_sample_keys = [test_set.sample_key(idx) for idx in range(len(test_set))]
+        if samples is not None:
+            return Subset(test_set, samples)
+        hits = cache.get(self._model_key, self._test_sample_keys, self.config['out_class_num'])
+        cached = [idx for idx, key in enumerate(self._test_sample_keys) if key in hits]
+        cached = cached[:max(0, len(test_set) - min_samples)]
+        print(f'Eval cache: {len(cached)} of {len(test_set)} test samples cached')
+        index = test_set.index
+        self._test_cache_hits = {
+            'index': np.array(cached, dtype=np.int64),
+            'clip_id': index.sample_clips[cached].astype(np.int64),
+            'name': np.array([os.path.basename(index.sample_paths(idx)[0]) for idx in cached], dtype=str),
+            'st_prob': np.array([hits[self._test_sample_keys[idx]][0] for idx in cached], dtype=np.float32).reshape(len(cached), self.config['out_class_num']),
+            'lf_prob': np.array([hits[self._test_sample_keys[idx]][1] for idx in cached], dtype=np.float32).reshape(len(cached), self.config['out_class_num']),
+            'st_target': index.labels[cached, :2].argmax(axis=1),
+            'lf_target': index.labels[cached, 2:4].argmax(axis=1),
+        }
+        cached = set(cached)
+        return Subset(test_set, [idx for idx in range(len(test_set)) if idx not in cached])
+
+    def cache_keys(self, samples):
+        """
+        Model key and {dataset index: sample key} of the samples, from the last test_dataset
+        lookup, for test_dataset(samples, cache_keys=...) in other processes. None without a cache.
+        """
+        if self._model_key is None:
+            return None
+        return self._model_key, {idx: self._test_sample_keys[idx] for idx in samples}
+
+    def cached_test_results(self):
+        """
+        ResultWriter.add columns of the test samples whose predictions came from the eval cache, or None.
+        """
+        if self._test_cache_hits is None or len(self._test_cache_hits['index']) == 0:
+            return None
+        return self._test_cache_hits
+
+    def cache_predictions(self, indices, st_prob, lf_prob):
+        """
+        Store the predictions of test samples (dataset indices) in the eval cache, if any.
+        """
+        if self.eval_cache() is None or self._model_key is None:
+            return
+        keys = [self._test_sample_keys[idx] for idx in indices.tolist()]
+        self.eval_cache().put(self._model_key, keys, st_prob.float().cpu().numpy(), lf_prob.float().cpu().numpy())
+
     def configure_optimizers(self):
-        optimizer = optim.Adam(self.parameters(),
+        optimizer = optim.Adam([p for p in self.parameters() if p.requires_grad],
                                lr=self.config['optim']['init_lr'])
         scheduler = optim.lr_scheduler.StepLR(optimizer,
                                               step_size=self.config['optim']['step_size'],
                                               gamma=self.config['optim']['step_factor'])
         return [optimizer], [scheduler]
 
-    def forward(self, images):
-        return self.model(images)
+    def forward(self, images, features=None, lengths=None):
+        return self.model(images, features, lengths)
 
     def training_step(self, batch, batch_idx):
-        print("TRAINING STEP")
         loss  = self.cal_loss_step(batch)
         self.log('train_loss', loss, prog_bar=True)
         return loss
 
+    def on_train_batch_end(self, outputs, batch, batch_idx):
+        # After backward, so the stages that training.checkpoint_backbone recomputes in the
+        # backward pass count in the step they belong to
+        if self.model.timer.enabled:
+            self.log_dict(self.model.timer.pop())
+
+    def on_train_epoch_end(self):
+        if self._frame_cache is not None:
+            stats = self._frame_cache.stats()
+            self.log_dict({
+                'frame_cache/hits': float(stats['hits']),
+                'frame_cache/misses': float(stats['misses']),
+                'frame_cache/hit_rate': stats['hit_rate'],
+            })
+
     def validation_step(self, batch, batch_idx):
-        print("VALIDATION STEP")
         loss = self.cal_loss_step(batch)
-        self.log('val_loss', loss, prog_bar=True)
+        self.log('val_loss', loss, prog_bar=True, sync_dist=True)
+        if self.model.timer.enabled:
+            self.log_dict(self.model.timer.pop('profile_val/'))
         return loss
 
+    def neck_stats(self):
+        """
+        Parameters and per frame latency of the neck, to compare neck variants across runs.
+        Measured once and kept, see shared_neck_stats for runs with several processes.
+        """
+        if self._neck_stats is None:
+            neck = self.model.down_conv
+            self._neck_stats = {
+                'neck/params_m': sum(p.numel() for p in neck.parameters()) / 1e6,
+                'neck/ms_per_frame': neck_latency_ms(neck, self.model.backbone.out_channels,
+                                                     (self.image_size()[0] // 32, self.image_size()[1] // 32)),
+            }
+        return self._neck_stats
+
+    def shared_neck_stats(self):
+        """
+        neck_stats of the first process on every process, so all of them log the same values.
+        """
+        self._neck_stats = self.trainer.strategy.broadcast(self.neck_stats())
+        return self._neck_stats
+
+    def on_train_start(self):
+        self.log_dict(self.shared_neck_stats())
+
+    def on_test_epoch_start(self):
+        self._test_results = []
+        self._test_cache_pending = []
+        # Each process writes its own result parts into a new directory of this test run
+        # under config['test']['test_result_pkl_dir'], if set, named by the first process
+        out_dir = self.config['test'].get('test_result_pkl_dir')
+        if out_dir:
+            run_name = self.trainer.strategy.broadcast(f'test_{time.strftime("%Y-%m-%d_%H:%M:%S")}_{os.getpid()}')
+            self.test_result_dir = os.path.join(out_dir, run_name)
+            if self.global_rank == 0:
+                print(f'Writing test results to {self.test_result_dir}')
+            self._result_writer = ResultWriter(self.test_result_dir, self.config['test']['sample_database_folder'], self.global_rank)
+        # Predictions from the eval cache count once, on the first process
+        cached = self.cached_test_results()
+        if cached is not None and self.global_rank == 0:
+            if self._result_writer is not None:
+                self._result_writer.add(**cached)
+            self._test_results.append(torch.from_numpy(np.stack([
+                cached['st_prob'].argmax(axis=1), cached['st_target'], cached['lf_prob'].argmax(axis=1), cached['lf_target']], axis=1)))
+
     def test_step(self, batch, batch_idx):
-        print("VALIDATION STEP")
-        _ = self.cal_ebeding_step(batch)
+        self._test_results.append(self.cal_ebeding_step(batch))
+        if self.model.timer.enabled:
+            self.log_dict(self.model.timer.pop('profile_test/'))
         return
 
+    def on_test_epoch_end(self):
+        if self._result_writer is not None:
+            self._result_writer.close()
+            self._result_writer = None
+        results = torch.cat(self._test_results) if self._test_results else torch.zeros((0, 4), dtype=torch.long)
+        if dist.is_available() and dist.is_initialized():
+            # Each process tested its own shard, see test_dataloader
+            shards = [None] * dist.get_world_size()
+            dist.all_gather_object(shards, results)
+            results = torch.cat(shards)
+        for indices, st_prob, lf_prob in self._test_cache_pending:
+            self.cache_predictions(indices, st_prob, lf_prob)
+        self._test_cache_pending = []
+        if self.eval_cache() is not None and self.global_rank == 0:
+            self.eval_cache().evict()
+        results = results.numpy()
+        st_correct = results[:, 0] == results[:, 1]
+        lf_correct = results[:, 2] == results[:, 3]
+        metrics = {
+            'test/st_acc': float(st_correct.mean()),
+            'test/lf_acc': float(lf_correct.mean()),
+            'test/acc': float((st_correct & lf_correct).mean()),
+        }
+        for name, (precision, recall, f1) in direction_precision_recall_f1(*results.T).items():
+            key = 'test/' + name.lower().replace(' ', '_')
+            metrics.update({key + '_precision': precision, key + '_recall': recall, key + '_f1': f1})
+        metrics.update(self.shared_neck_stats())
+        self.log_dict(metrics)
+
     def cal_loss_step(self, batch):
-        images = batch["images"]
-        head1_out, head2_out = self.model(images) # (bs, 1, 1024, 1)
-        st_lightstatus_class = self.class_decoder_st(head1_out, batch["label"][:,:2])
-        lf_lightstatus_class = self.class_decoder_lf(head2_out, batch["label"][:,2:4])
+        head1_out, head2_out = self.model(batch.get("images"), batch.get("features"), batch.get("length")) # (bs, 1, 1024, 1)
+        with self.model.timer.stage('decoders', head1_out.device):
+            st_lightstatus_class = self.class_decoder_st(head1_out, batch["label"][:,:2])
+            lf_lightstatus_class = self.class_decoder_lf(head2_out, batch["label"][:,2:4])
         st_class_loss = self.prob_loss(st_lightstatus_class, batch["label"][:,:2])
         lf_class_loss = self.prob_loss(lf_lightstatus_class, batch["label"][:,2:4])
         class_loss = st_class_loss + lf_class_loss
@@ -166,35 +512,52 @@ class LightFormerPredictor(pl.LightningModule, nn.Module):
         Calculate the
         """
         gt_label_idx = torch.argmax(gt_label,dim=-1)
-        pred_cls_score = torch.log(lightstatus)
-        loss = F.nll_loss(pred_cls_score.squeeze(-1), gt_label_idx, reduction='mean')
+        # fp32 under mixed precision, bf16 keeps only 8 mantissa bits, too coarse for the log probabilities and the loss
+        with torch.autocast('cuda' if lightstatus.is_cuda else 'cpu', enabled=False):
+            pred_cls_score = torch.log(lightstatus.float())
+            loss = F.nll_loss(pred_cls_score.squeeze(-1), gt_label_idx, reduction='mean')
         return loss
 
+    def decode_probs(self, head1_out, head2_out):
+        """
+        Straight and left turn class probabilities [B, out_class_num] from the two head outputs.
+        """
+        B = head1_out.shape[0]
+        with self.model.timer.stage('decoders', head1_out.device):
+            st_prob = self.class_decoder_st(head1_out, None).view(B, self.config["out_class_num"])
+            lf_prob = self.class_decoder_lf(head2_out, None).view(B, self.config["out_class_num"])
+        return st_prob, lf_prob
+
+    @torch.no_grad()
+    def predict_probs(self, images, features=None, lengths=None):
+        """
+        images: [B, image_num, 3, h, w] windows, uint8 or normalized float
+        features: [B, image_num, 256, h', w'] precomputed frame features, used instead of images when given
+        lengths: [B] valid leading frames of each window, all frames if not given
+        returns: straight and left turn probabilities, [B, out_class_num] each
+        """
+        return self.decode_probs(*self.model(images, features, lengths))
+
     def cal_ebeding_step(self, batch):
-        images = batch["images"]
-        head1_out, head2_out = self.model(images)
-        st_lightstatus = self.class_decoder_st(head1_out,None)
-        lf_lightstatus = self.class_decoder_lf(head2_out,None)
-        B, K, _ = st_lightstatus.shape
-        st_prob = st_lightstatus.view(B, self.config["out_class_num"], 1)
-        lf_prob = lf_lightstatus.view(B, self.config["out_class_num"], 1)
-        st_predict=st_prob.argmax(dim=1)[0][0]
-        lf_predict=lf_prob.argmax(dim=1)[0][0]
-        st_target=batch["label"][:,:2].argmax(dim=1)[0]
-        lf_target=batch["label"][:,2:4].argmax(dim=1)[0]
-        with open("complete_model_Kaggle_daytime_n=1_res1.txt","a+") as f:
-            flag='right'
-            if(st_predict!=st_target) or (lf_predict!=lf_target):
-                flag = 'error'
-            ss = "{} {} {} {} {} {}\n".format(batch["name"], st_predict, st_target, lf_predict, lf_target, flag)
-            f.write(ss)
-            f.flush()
-        return 0
+        """
+        Buffer the class probabilities and targets of every sample in the result writer, if any,
+        and return the predicted and target classes [B, 4]: st_predict, st_target, lf_predict, lf_target.
+        """
+        st_prob, lf_prob = self.predict_probs(batch.get("images"), batch.get("features"), batch.get("length"))
+        st_target = batch["label"][:,:2].argmax(dim=1)
+        lf_target = batch["label"][:,2:4].argmax(dim=1)
+        if self._result_writer is not None:
+            self._result_writer.add(batch["index"], batch["clip_id"], batch["name"], st_prob, lf_prob, st_target, lf_target)
+        if self._model_key is not None:
+            # Stored at the end of the epoch, once every process has looked up its cached samples
+            self._test_cache_pending.append((batch["index"], st_prob.detach().cpu(), lf_prob.detach().cpu()))
+        return torch.stack([st_prob.argmax(dim=1), st_target, lf_prob.argmax(dim=1), lf_target], dim=1).cpu()
 
     def train_dataloader(self):
-        image_norm = [(0.485, 0.456, 0.406), (0.229, 0.224, 0.225)]
-        transform = transforms.Normalize(mean=image_norm[0], std=image_norm[1])
-        train_set = LightFormerDataset(self.config['training']['sample_database_folder'], transform)
+        train_set = LightFormerDataset(self.config['training']['sample_database_folder'],
+                                       frame_cache=self.frame_cache(), frame_store=self.frame_store(),
+                                       decode_backend=self.decode_backend(), feature_store=self.feature_store(),
+                                       image_num=self.config['image_num'], image_size=self.image_size())
         # print("what is this", self.config['training']['sample_database_folder'])
         print(f"...............................Total Samples {len(train_set)} .......................................")
         train_loader = DataLoader(dataset=train_set,
@@ -208,8 +571,10 @@ class LightFormerPredictor(pl.LightningModule, nn.Module):
         return train_loader
 
     def val_dataloader(self):
-        image_norm = [(0.485, 0.456, 0.406), (0.229, 0.224, 0.225)]
-        val_set = LightFormerDataset(self.config['validation']['sample_database_folder'], image_norm)
+        val_set = LightFormerDataset(self.config['validation']['sample_database_folder'],
+                                     frame_cache=self.frame_cache(), frame_store=self.frame_store(),
+                                     decode_backend=self.decode_backend(), feature_store=self.feature_store(),
+                                     image_num=self.config['image_num'], image_size=self.image_size())
         val_loader = DataLoader(val_set,
                                 batch_size=self.config['validation']['batch_size'],
                                 shuffle=False,
@@ -221,11 +586,14 @@ class LightFormerPredictor(pl.LightningModule, nn.Module):
         return val_loader
 
     def test_dataloader(self):
-        image_norm = [(0.485, 0.456, 0.406), (0.229, 0.224, 0.225)]
-        test_set = LightFormerDataset(self.config['test']['sample_database_folder'], image_norm)
+        # Leave every process a sample to compute, a test loop without batches skips its epoch hooks
+        test_set = self.test_dataset(min_samples=dist.get_world_size() if dist.is_available() and dist.is_initialized() else 1)
+        # With several processes each tests a disjoint shard, Lightning's sampler would repeat samples
+        sampler = ShardSampler(test_set) if dist.is_available() and dist.is_initialized() else None
         test_loader = DataLoader(test_set,
                                  batch_size=self.config['test']['batch_size'],
                                  shuffle=False,
+                                 sampler=sampler,
                                  # collate_fn=AgentClosureBatch.from_data_list,
                                  num_workers=self.config['test']['loader_worker_num'],
                                  drop_last=False,
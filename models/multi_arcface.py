@@ -33,8 +33,7 @@ class MultiArcFace(nn.Module):
 
     def forward(self, input, label=None):
         if label is None:
-            input = input.squeeze()
-            input = input.view(1,1024)
+            input = input.reshape(input.shape[0], self.in_features)
             return F.linear(F.normalize(input), F.normalize(self.weight))
         input = input.squeeze(1)
         input = input.squeeze(2)
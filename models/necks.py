@@ -0,0 +1,96 @@
+import time
+import torch
+import torch.nn as nn
+from .profiler import _synchronize
+
+
+def conv_neck(in_channels, out_channels=256):
+    """
+    The original down_conv: Conv 3x3 to 1024 channels, then Conv 3x3 to out_channels.
+    """
+    return nn.Sequential(
+        nn.Conv2d(in_channels, 1024, 3),
+        nn.BatchNorm2d(1024),
+        nn.ReLU(),
+        nn.Conv2d(1024, out_channels, 3),
+        nn.BatchNorm2d(out_channels)
+    )
+
+
+def depthwise_neck(in_channels, out_channels=256):
+    """
+    Two depthwise separable 3x3 convolutions, same receptive field and output size as conv_neck.
+    """
+    return nn.Sequential(
+        nn.Conv2d(in_channels, in_channels, 3, groups=in_channels, bias=False),
+        nn.Conv2d(in_channels, out_channels, 1),
+        nn.BatchNorm2d(out_channels),
+        nn.ReLU(),
+        nn.Conv2d(out_channels, out_channels, 3, groups=out_channels, bias=False),
+        nn.Conv2d(out_channels, out_channels, 1),
+        nn.BatchNorm2d(out_channels)
+    )
+
+
+def bottleneck_neck(in_channels, out_channels=256, width=128):
+    """
+    1x1 reduction to `width` channels before the two 3x3 convolutions, same output size as conv_neck.
+    """
+    return nn.Sequential(
+        nn.Conv2d(in_channels, width, 1),
+        nn.BatchNorm2d(width),
+        nn.ReLU(),
+        nn.Conv2d(width, width, 3),
+        nn.BatchNorm2d(width),
+        nn.ReLU(),
+        nn.Conv2d(width, out_channels, 3),
+        nn.BatchNorm2d(out_channels)
+    )
+
+
+def single_neck(in_channels, out_channels=256):
+    """
+    A single 3x3 convolution. The feature map is one pixel larger on each side than with
+    conv_neck, the encoder builds its reference points from the actual size.
+    """
+    return nn.Sequential(
+        nn.Conv2d(in_channels, out_channels, 3),
+        nn.BatchNorm2d(out_channels)
+    )
+
+
+NECKS = {
+    'conv': conv_neck,
+    'depthwise': depthwise_neck,
+    'bottleneck': bottleneck_neck,
+    'single': single_neck,
+}
+
+
+def build_neck(name='conv', in_channels=512, out_channels=256):
+    """
+    Build a neck of NECKS, mapping backbone features to the out_channels the Encoder expects.
+    """
+    if name not in NECKS:
+        raise ValueError(f"unknown neck {name}, expected one of {sorted(NECKS)}")
+    return NECKS[name](in_channels, out_channels)
+
+
+@torch.no_grad()
+def neck_latency_ms(neck, in_channels, feature_size=(16, 30), num_frames=10, iterations=3):
+    """
+    Milliseconds per frame of `neck` on a window of backbone feature maps, the stride 32
+    output of a 512 x 960 frame by default.
+    """
+    device = next(neck.parameters()).device
+    training = neck.training
+    neck.eval()
+    features = torch.randn(num_frames, in_channels, *feature_size, device=device)
+    neck(features) # warm up
+    _synchronize(device)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        neck(features)
+    _synchronize(device)
+    neck.train(training)
+    return (time.perf_counter() - start) * 1000 / iterations / num_frames
@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+import torch
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process so far, in MB.
+    """
+    import resource
+    # ru_maxrss is in bytes on macOS, in KiB elsewhere
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 2**20 if sys.platform == 'darwin' else maxrss / 1024
+
+
+def _rss_mb():
+    """
+    Resident set size of this process, the peak so far where /proc is not available (macOS).
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def _synchronize(device):
+    """
+    Wait for the queued kernels of a cuda or mps device, so stage times measure execution, not dispatch.
+    """
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    elif device.type == 'mps' and hasattr(torch, 'mps'):
+        torch.mps.synchronize()
+
+
+class StageTimer:
+    """
+    Wall time and memory of the named stages of the LightFormer forward pass.
+
+    Stages are timed with `with timer.stage(name, device):` and accumulated until `pop`,
+    which returns them as TensorBoard scalars, once per training step. Every stage is also a
+    torch.profiler record_function, so it shows up by name in profiler traces. Asynchronous
+    devices are synchronized around each stage. Memory is the peak allocated CUDA memory
+    during the stage, the allocated MPS memory after it on mps, and the resident set size
+    after it on CPU (the peak so far on macOS). A disabled timer does nothing.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.times = OrderedDict()
+        self.memory = OrderedDict()
+
+    @contextmanager
+    def stage(self, name, device=None):
+        if not self.enabled:
+            yield
+            return
+        device = torch.device(device if device is not None else 'cpu')
+        if device.type == 'cuda':
+            torch.cuda.reset_peak_memory_stats(device)
+        _synchronize(device)
+        start = time.perf_counter()
+        with torch.profiler.record_function(name):
+            yield
+        _synchronize(device)
+        self.times[name] = self.times.get(name, 0.0) + time.perf_counter() - start
+        if device.type == 'cuda':
+            memory = torch.cuda.max_memory_allocated(device) / 2**20
+        elif device.type == 'mps' and hasattr(torch, 'mps'):
+            memory = torch.mps.current_allocated_memory() / 2**20
+        else:
+            memory = _rss_mb()
+        self.memory[name] = max(self.memory.get(name, 0.0), memory)
+
+    def pop(self, prefix='profile/'):
+        """
+        Milliseconds and memory (MB) per stage since the last pop, then reset.
+        """
+        stats = {}
+        for name, seconds in self.times.items():
+            stats[f'{prefix}{name}_ms'] = seconds * 1000
+            stats[f'{prefix}{name}_mb'] = self.memory[name]
+        self.times.clear()
+        self.memory.clear()
+        return stats
@@ -1,7 +1,26 @@
 import torch
 import torch.nn as nn
-import mmcv
-from mmcv.ops.multi_scale_deform_attn import multi_scale_deformable_attn_pytorch
+import torch.nn.functional as F
+
+
+def deformable_attn(value, h, w, sampling_locations, attention_weights):
+    """
+    Single level deformable attention on grid_sample, numerically the same as mmcv's
+    multi_scale_deformable_attn_pytorch with one level, without the mmcv dependency.
+
+    value: [bs, h*w, num_heads, head_dim]
+    sampling_locations: [bs, num_query, num_heads, num_pts, 2] normalized (x, y) in [0, 1]
+    attention_weights: [bs, num_query or 1, num_heads, num_pts], broadcast over queries
+    returns: [bs, num_query, num_heads*head_dim]
+    """
+    bs, _, num_heads, head_dim = value.shape
+    _, num_query, _, num_pts, _ = sampling_locations.shape
+    value = value.flatten(2).transpose(1, 2).reshape(bs*num_heads, head_dim, h, w)
+    sampling_grids = (2*sampling_locations - 1).transpose(1, 2).flatten(0, 1) # [bs*num_heads, num_query, num_pts, 2]
+    sampled = F.grid_sample(value, sampling_grids, mode='bilinear', padding_mode='zeros', align_corners=False) # [bs*num_heads, head_dim, num_query, num_pts]
+    attention_weights = attention_weights.transpose(1, 2).reshape(bs*num_heads, 1, -1, num_pts)
+    output = (sampled * attention_weights).sum(-1).view(bs, num_heads*head_dim, num_query)
+    return output.transpose(1, 2).contiguous()
 
 
 class sca(nn.Module): # spatial cross attention
@@ -13,6 +32,8 @@ class sca(nn.Module): # spatial cross attention
         self.num_pts = self.config["num_sam_pts"]
         self.num_levels = self.config["num_levels"]
         self.embed_dim = self.config["embed_dim"]
+        if self.num_levels != 1:
+            raise ValueError(f"sca attends to a single feature level, got num_levels={self.num_levels}")
         self.sampling_offset = nn.Linear(self.embed_dim, self.num_heads*self.num_pts*self.num_levels*2)
         self.attention_weights = nn.Linear(self.embed_dim, self.num_heads*self.num_pts*self.num_levels)
         self.norm = nn.LayerNorm(self.embed_dim)
@@ -22,20 +43,19 @@ class sca(nn.Module): # spatial cross attention
         """
         query:[bs,1,embed_dim]
         single_feat:[bs, h*w, num_heads, embed_dim/num_heads]
+        ref_2d:[bs, h*w, 1, 2]
         """
-        bs, num_query, _, _ = single_feat.shape
-        query = query.repeat(1, h*w, 1)
+        bs = single_feat.shape[0]
+        # The single query is shared by all h*w reference points, so project it once and broadcast
         sampling_offsets = self.sampling_offset(query)
         sampling_offsets = sampling_offsets.relu()
-        sampling_offsets = sampling_offsets.view(bs, h*w, self.num_heads,  self.num_levels, self.num_pts, 2)
-        spatial_shapes = torch.tensor([[h, w]], device=query.device)
-        offset_normalizer = torch.stack([spatial_shapes[..., 1], spatial_shapes[..., 0]], -1)
-        sampling_locations = ref_2d[:, :, None, :, None, :] + sampling_offsets / offset_normalizer[None, None, None, :, None, :]
+        sampling_offsets = sampling_offsets.view(bs, 1, self.num_heads, self.num_pts, 2)
+        offset_normalizer = sampling_offsets.new_tensor([w, h])
+        sampling_locations = ref_2d[:, :, None, :, :] + sampling_offsets / offset_normalizer # [bs, h*w, num_heads, num_pts, 2]
         attention_weights = self.attention_weights(query)
         attention_weights = attention_weights.relu()
-        attention_weights = attention_weights.view(bs, h*w, self.num_heads,  self.num_levels, self.num_pts)
+        attention_weights = attention_weights.view(bs, 1, self.num_heads, self.num_pts)
         attention_weights = attention_weights.softmax(-1)
-        value = single_feat.view(bs, num_query, self.num_heads, -1)
-        output = multi_scale_deformable_attn_pytorch(value, spatial_shapes, sampling_locations, attention_weights)
+        output = deformable_attn(single_feat, h, w, sampling_locations, attention_weights)
         output  = self.norm(self.dropout(output) + query)
         return output
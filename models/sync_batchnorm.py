@@ -0,0 +1,74 @@
+import torch
+import torch.distributed as dist
+import torch.distributed.nn.functional as dist_fn
+import torch.nn as nn
+
+
+class SyncBatchNorm2d(nn.BatchNorm2d):
+    """
+    BatchNorm2d whose training statistics are computed over the batches of all processes.
+
+    torch.nn.SyncBatchNorm only accepts GPU input. This version reduces the per channel sums
+    with differentiable all_reduce calls, so it runs on CPU over gloo as well. Outside of
+    training, or without an initialized process group of more than one process, it is a
+    plain BatchNorm2d. Every process must call it the same number of times per step.
+    """
+
+    def __init__(self, num_features, eps=1e-5, momentum=0.1, affine=True,
+                 track_running_stats=True, process_group=None):
+        super().__init__(num_features, eps, momentum, affine, track_running_stats)
+        self.process_group = process_group
+
+    def _group(self):
+        return self.process_group or dist.group.WORLD
+
+    def forward(self, input):
+        if not (self.training and dist.is_available() and dist.is_initialized()
+                and dist.get_world_size(self._group()) > 1):
+            return super().forward(input)
+
+        # Mean, then the centered variance, over the frames of every process, in fp32 like
+        # the native batch norm, also for bf16 input under mixed precision
+        x = input.float()
+        count = x.new_tensor([x.numel() / x.shape[1]])
+        sums = dist_fn.all_reduce(torch.cat([x.sum(dim=(0, 2, 3)), count]), group=self._group())
+        total = sums[-1]
+        mean = sums[:-1] / total
+        centered = x - mean.view(1, -1, 1, 1)
+        var = dist_fn.all_reduce((centered * centered).sum(dim=(0, 2, 3)), group=self._group()) / total
+
+        if self.track_running_stats:
+            with torch.no_grad():
+                self.num_batches_tracked += 1
+                if self.momentum is None: # cumulative moving average
+                    factor = 1.0 / float(self.num_batches_tracked)
+                else:
+                    factor = self.momentum
+                self.running_mean.mul_(1 - factor).add_(mean, alpha=factor)
+                self.running_var.mul_(1 - factor).add_(var * total / (total - 1).clamp(min=1), alpha=factor)
+
+        output = centered * torch.rsqrt(var + self.eps).view(1, -1, 1, 1)
+        if self.affine:
+            output = output * self.weight.view(1, -1, 1, 1) + self.bias.view(1, -1, 1, 1)
+        return output.to(input.dtype)
+
+
+def convert_sync_batchnorm(module, process_group=None):
+    """
+    Replace every BatchNorm2d of `module` by a SyncBatchNorm2d with the same parameters
+    and statistics, like torch.nn.SyncBatchNorm.convert_sync_batchnorm.
+    """
+    converted = module
+    if isinstance(module, nn.BatchNorm2d) and not isinstance(module, SyncBatchNorm2d):
+        converted = SyncBatchNorm2d(module.num_features, module.eps, module.momentum, module.affine,
+                                    module.track_running_stats, process_group)
+        if module.affine:
+            converted.weight = module.weight
+            converted.bias = module.bias
+        converted.running_mean = module.running_mean
+        converted.running_var = module.running_var
+        converted.num_batches_tracked = module.num_batches_tracked
+        converted.train(module.training)
+    for name, child in module.named_children():
+        converted.add_module(name, convert_sync_batchnorm(child, process_group))
+    return converted
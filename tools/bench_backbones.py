@@ -0,0 +1,79 @@
+import argparse
+import copy
+import json
+import sys
+sys.path.append('.')
+import time
+import torch
+import torch.nn as nn
+from models.backbones import BACKBONES
+from models.light_former import LightFormer
+
+
+def parse_args() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='list FLOPs, parameters and cpu latency of the per-frame encoder (backbone + down_conv) for every registered backbone.')
+    parser.add_argument('-cfg', '--config', type=str, default='', required=True, help='config file')
+    parser.add_argument('-bb', '--backbones', type=str, nargs='+', default=list(BACKBONES), help='backbones to compare')
+    parser.add_argument('-b', '--batch_size', type=int, default=10, help='frames per timed batch, one window by default')
+    parser.add_argument('-n', '--iterations', type=int, default=3, help='timed iterations per backbone')
+    parser.add_argument('-t', '--threads', type=int, default=None, help='torch cpu threads')
+    args = parser.parse_args()
+    return args
+
+
+def count_flops(module, *inputs):
+    """
+    FLOPs (2 x multiply-accumulates) of the convolution and linear layers in one forward pass.
+    """
+    flops = []
+
+    def conv_hook(layer, _, output):
+        kernel = layer.weight[0].numel() # in_channels / groups * kh * kw
+        flops.append(2 * output.numel() * kernel)
+
+    def linear_hook(layer, _, output):
+        flops.append(2 * output.numel() * layer.in_features)
+
+    handles = []
+    for layer in module.modules():
+        if isinstance(layer, nn.Conv2d):
+            handles.append(layer.register_forward_hook(conv_hook))
+        elif isinstance(layer, nn.Linear):
+            handles.append(layer.register_forward_hook(linear_hook))
+    with torch.no_grad():
+        module(*inputs)
+    for handle in handles:
+        handle.remove()
+    return sum(flops)
+
+
+def latency_ms(fn, inputs, iterations):
+    with torch.no_grad():
+        fn(inputs) # warm up
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn(inputs)
+    return (time.perf_counter() - start) * 1000 / iterations
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+    image_size = config.get('image_size', [512, 960])
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    frame = torch.randint(0, 256, (1, 3, *image_size), dtype=torch.uint8)
+    frames = torch.randint(0, 256, (args.batch_size, 3, *image_size), dtype=torch.uint8)
+    print(f'| backbone | channels | params (M) | GFLOPs / frame | ms / frame |')
+    print(f'|---|---|---|---|---|')
+    for name in args.backbones:
+        model_config = copy.deepcopy(config)
+        model_config['backbone'] = {'name': name, 'weights': None}
+        model = LightFormer(model_config).eval()
+        encoder = nn.Sequential(model.backbone, model.down_conv)
+        params = sum(p.numel() for p in encoder.parameters()) / 1e6
+        gflops = count_flops(encoder, model.normalize(frame)) / 1e9
+        ms = latency_ms(model.encode_frames, frames, args.iterations) / args.batch_size
+        print(f'| {name} | {model.backbone.out_channels} | {params:.2f} | {gflops:.2f} | {ms:.1f} |', flush=True)
@@ -0,0 +1,99 @@
+import argparse
+import copy
+import json
+import os
+import sys
+sys.path.append('.')
+import time
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.nn as nn
+from torch.nn.parallel import DistributedDataParallel
+from models.light_former import LightFormerPredictor
+from models.sync_batchnorm import convert_sync_batchnorm
+
+
+def parse_args() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='training throughput and scaling efficiency of cpu data parallel training over gloo, from 1 to N processes.')
+    parser.add_argument('-cfg', '--config', type=str, default='', required=True, help='config file')
+    parser.add_argument('-p', '--processes', type=int, nargs='+', default=[1, 2, 4], help='process counts to compare')
+    parser.add_argument('-b', '--batch_size', type=int, default=None, help='windows per process and step, training.batch_size if not given')
+    parser.add_argument('-n', '--steps', type=int, default=3, help='timed training steps')
+    parser.add_argument('-t', '--threads', type=int, default=None, help='torch threads per process, the cpu cores split evenly if not given')
+    parser.add_argument('--port', type=int, default=29512, help='rendezvous port on localhost')
+    args = parser.parse_args()
+    return args
+
+
+class TrainStep(nn.Module):
+    """
+    Loss of a batch as the forward pass, so that DistributedDataParallel synchronizes its backward.
+    """
+
+    def __init__(self, predictor):
+        super().__init__()
+        self.predictor = predictor
+
+    def forward(self, batch):
+        return self.predictor.cal_loss_step(batch)
+
+
+def worker(rank, world_size, config, batch_size, steps, threads, port, queue):
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = str(port)
+    torch.set_num_threads(threads)
+    dist.init_process_group('gloo', rank=rank, world_size=world_size)
+
+    torch.manual_seed(rank)
+    predictor = LightFormerPredictor(config=config).train()
+    predictor.model.down_conv = convert_sync_batchnorm(predictor.model.down_conv)
+    model = DistributedDataParallel(TrainStep(predictor))
+    optimizer = predictor.configure_optimizers()[0][0]
+    batch = {
+        'images': torch.randint(0, 256, (batch_size, config['image_num'], 3, *config.get('image_size', [512, 960])), dtype=torch.uint8),
+        'label': torch.eye(2).repeat(batch_size // 2 + 1, 2)[:batch_size],
+    }
+
+    def step():
+        optimizer.zero_grad()
+        model(batch).backward()
+        optimizer.step()
+
+    step() # warm up
+    dist.barrier()
+    start = time.perf_counter()
+    for _ in range(steps):
+        step()
+    dist.barrier()
+    if rank == 0:
+        queue.put(time.perf_counter() - start)
+    dist.destroy_process_group()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+
+    # Weights do not change the step time, and the step must not read a feature store
+    config = copy.deepcopy(config)
+    config['backbone'] = dict(config.get('backbone', {}), weights=None)
+    config['data'] = dict(config.get('data', {}), feature_store=None)
+    batch_size = args.batch_size or config['training']['batch_size']
+
+    context = mp.get_context('spawn')
+    print(f'{batch_size} windows per process and step, {os.cpu_count()} cpu cores')
+    print(f'| processes | threads / process | s / step | windows / s | speedup | efficiency |')
+    print(f'|---|---|---|---|---|---|')
+    baseline = None
+    for world_size in args.processes:
+        threads = args.threads or max(1, os.cpu_count() // world_size)
+        queue = context.SimpleQueue()
+        mp.start_processes(worker, args=(world_size, config, batch_size, args.steps, threads, args.port, queue),
+                           nprocs=world_size, start_method='spawn')
+        seconds = queue.get() / args.steps
+        throughput = world_size * batch_size / seconds
+        baseline = baseline or throughput
+        speedup = throughput / baseline
+        print(f'| {world_size} | {threads} | {seconds:.2f} | {throughput:.2f} | {speedup:.2f}x | {speedup / world_size * args.processes[0] * 100:.0f}% |', flush=True)
@@ -0,0 +1,55 @@
+import argparse
+import json
+import sys
+sys.path.append('.')
+import time
+import numpy as np
+from dataset.decode import DECODE_BACKENDS
+from dataset.sample_index import SampleIndex
+
+
+def parse_args() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='compare decode backends against the skimage reference: parity and frames per second.')
+    parser.add_argument('-cfg', '--config', type=str, default='', required=True, help='config file')
+    parser.add_argument('-s', '--split', type=str, default='training', help='config section whose frames are decoded')
+    parser.add_argument('-l', '--limit', type=int, default=100, help='number of frames to decode per backend')
+    parser.add_argument('-b', '--backends', type=str, nargs='+', default=sorted(DECODE_BACKENDS), help='backends to compare')
+    args = parser.parse_args()
+    return args
+
+
+def sample_frames(config, split, limit):
+    index = SampleIndex(config[split]['sample_database_folder'])
+    return [index.frame_path(frame_id) for frame_id in range(min(limit, index.num_frames))]
+
+
+def run_backend(decode, paths, image_size):
+    start = time.perf_counter()
+    frames = [decode(path, tuple(image_size)).numpy() for path in paths]
+    return frames, len(paths) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+
+    image_size = config.get('image_size', [512, 960])
+    paths = sample_frames(config, args.split, args.limit)
+    print(f'Decoding {len(paths)} frames to {image_size[0]}x{image_size[1]}')
+
+    reference, reference_fps = run_backend(DECODE_BACKENDS['skimage'], paths, image_size)
+    print(f"{'backend':<12} {'fps':>8} {'speedup':>8} {'mean |diff|':>12} {'max |diff|':>11} {'psnr dB':>8}")
+    for name in args.backends:
+        if name == 'skimage':
+            frames, fps = reference, reference_fps
+        else:
+            try:
+                frames, fps = run_backend(DECODE_BACKENDS[name], paths, image_size)
+            except ImportError as e:
+                print(f'{name:<12} skipped, {e}')
+                continue
+        diff = np.stack([np.abs(a.astype('int16') - b.astype('int16')) for a, b in zip(frames, reference)])
+        mse = float((diff.astype('float64') ** 2).mean())
+        psnr = 10 * np.log10(255.0 ** 2 / mse) if mse > 0 else float('inf')
+        print(f'{name:<12} {fps:8.1f} {fps / reference_fps:7.2f}x {diff.mean():12.3f} {diff.max():11d} {psnr:8.2f}')
@@ -0,0 +1,80 @@
+import argparse
+import json
+import sys
+sys.path.append('.')
+import time
+import torch
+from models.encoder import Encoder
+from models.spatial_cross_attention import sca
+
+
+def parse_args() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='parity and latency of the native spatial cross attention against the mmcv version.')
+    parser.add_argument('-cfg', '--config', type=str, default='', required=True, help='config file')
+    parser.add_argument('-b', '--batch_size', type=int, default=8, help='batch size')
+    parser.add_argument('--height', type=int, default=12, help='feature map height, 12 for 512x960 frames')
+    parser.add_argument('--width', type=int, default=26, help='feature map width, 26 for 512x960 frames')
+    parser.add_argument('-i', '--iters', type=int, default=50, help='timed iterations')
+    args = parser.parse_args()
+    return args
+
+
+def mmcv_sca_forward(module, query, single_feat, ref_2d, h, w):
+    """
+    The previous sca.forward: repeat the query h*w times and call mmcv.
+    """
+    from mmcv.ops.multi_scale_deform_attn import multi_scale_deformable_attn_pytorch
+    bs, num_query, _, _ = single_feat.shape
+    query = query.repeat(1, h*w, 1)
+    sampling_offsets = module.sampling_offset(query).relu()
+    sampling_offsets = sampling_offsets.view(bs, h*w, module.num_heads, module.num_levels, module.num_pts, 2)
+    spatial_shapes = torch.tensor([[h, w]], device=query.device)
+    offset_normalizer = torch.stack([spatial_shapes[..., 1], spatial_shapes[..., 0]], -1)
+    sampling_locations = ref_2d[:, :, None, :, None, :] + sampling_offsets / offset_normalizer[None, None, None, :, None, :]
+    attention_weights = module.attention_weights(query).relu()
+    attention_weights = attention_weights.view(bs, h*w, module.num_heads, module.num_levels, module.num_pts).softmax(-1)
+    value = single_feat.view(bs, num_query, module.num_heads, -1)
+    output = multi_scale_deformable_attn_pytorch(value, spatial_shapes, sampling_locations, attention_weights)
+    return module.norm(module.dropout(output) + query)
+
+
+def time_ms(fn, iters):
+    with torch.no_grad():
+        fn()
+        start = time.perf_counter()
+        for _ in range(iters):
+            fn()
+    return (time.perf_counter() - start) * 1000 / iters
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+
+    torch.manual_seed(0)
+    module = sca(config).eval()
+    bs, h, w = args.batch_size, args.height, args.width
+    num_heads = config['num_heads']
+    query = torch.randn(bs, 1, config['embed_dim'])
+    single_feat = torch.randn(bs, h*w, num_heads, config['embed_dim'] // num_heads)
+    ref_2d = Encoder.get_reference_points(h, w, bs, 'cpu')
+
+    native = lambda: module(query, single_feat, ref_2d, h, w)
+    native_ms = time_ms(native, args.iters)
+    print(f'native: {native_ms:.3f} ms')
+
+    try:
+        import mmcv
+    except ImportError:
+        print('mmcv is not installed, skipping parity check and mmcv latency')
+        exit(0)
+    reference = lambda: mmcv_sca_forward(module, query, single_feat, ref_2d, h, w)
+    with torch.no_grad():
+        diff = (native() - reference()).abs().max()
+    mmcv_ms = time_ms(reference, args.iters)
+    print(f'mmcv:   {mmcv_ms:.3f} ms ({mmcv_ms / native_ms:.2f}x slower)')
+    print(f'max |diff|: {float(diff):.3e}')
+    if diff > 1e-5:
+        print('PARITY FAILED')
+        exit(1)
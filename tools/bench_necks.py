@@ -0,0 +1,44 @@
+import argparse
+import json
+import sys
+sys.path.append('.')
+import torch
+from models.backbones import build_backbone
+from models.necks import NECKS, build_neck, neck_latency_ms
+from tools.bench_backbones import count_flops
+
+
+def parse_args() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='list parameters, FLOPs and cpu latency of every neck variant on the configured backbone.')
+    parser.add_argument('-cfg', '--config', type=str, default='', required=True, help='config file')
+    parser.add_argument('-nk', '--necks', type=str, nargs='+', default=list(NECKS), help='necks to compare')
+    parser.add_argument('-n', '--iterations', type=int, default=5, help='timed iterations per neck')
+    parser.add_argument('-t', '--threads', type=int, default=None, help='torch cpu threads')
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    backbone = config.get('backbone', {}).get('name', 'resnet18')
+    in_channels = build_backbone(backbone, None).out_channels
+    # Stride 32 backbone output of a config['image_size'] frame
+    image_size = config.get('image_size', [512, 960])
+    feature_size = (image_size[0] // 32, image_size[1] // 32)
+    features = torch.randn(1, in_channels, *feature_size)
+    print(f'{backbone} backbone, {in_channels} channels')
+    print(f'| neck | output | params (M) | GFLOPs / frame | ms / frame |')
+    print(f'|---|---|---|---|---|')
+    for name in args.necks:
+        neck = build_neck(name, in_channels, 256).eval()
+        with torch.no_grad():
+            output = tuple(neck(features).shape[1:])
+        params = sum(p.numel() for p in neck.parameters()) / 1e6
+        gflops = count_flops(neck, features) / 1e9
+        ms = neck_latency_ms(neck, in_channels, feature_size, iterations=args.iterations)
+        print(f'| {name} | {output} | {params:.2f} | {gflops:.2f} | {ms:.2f} |', flush=True)
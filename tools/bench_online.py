@@ -0,0 +1,60 @@
+import argparse
+import json
+import sys
+sys.path.append('.')
+import time
+import torch
+from models.light_former import LightFormerPredictor
+from inference.online import OnlineLightFormer
+
+
+def parse_args() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='compare full window inference with online per frame inference on cpu.')
+    parser.add_argument('-cfg', '--config', type=str, default='', required=True, help='config file')
+    parser.add_argument('-ckpt', '--checkpoint', type=str, default=None, help='checkpoint file, random weights if not given')
+    parser.add_argument('-s', '--steps', type=int, default=20, help='number of timed decisions')
+    parser.add_argument('-t', '--threads', type=int, default=None, help='torch cpu threads')
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+    image_size = config.get('image_size', [512, 960])
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    if args.checkpoint is None:
+        predictor = LightFormerPredictor(config=config)
+    else:
+        predictor = LightFormerPredictor.load_from_checkpoint(args.checkpoint, config=config, map_location='cpu')
+    predictor.eval()
+    online = OnlineLightFormer(predictor)
+
+    image_num = config['image_num']
+    frames = torch.randint(0, 256, (image_num + args.steps, 3, *image_size), dtype=torch.uint8)
+
+    # Fill the ring buffer, then check that both paths agree on a full window
+    for frame in frames[:image_num]:
+        online.step(frame)
+    with torch.no_grad():
+        window = frames[1:image_num + 1][None]
+        st_full, lf_full = predictor.decode_probs(*predictor(window))
+    st_online, lf_online = online.step(frames[image_num])
+    print(f'max |diff| straight {float((st_full[0] - st_online).abs().max()):.2e}, left {float((lf_full[0] - lf_online).abs().max()):.2e}')
+
+    with torch.no_grad():
+        start = time.perf_counter()
+        for i in range(args.steps):
+            predictor.decode_probs(*predictor(frames[i:i + image_num][None]))
+        full_ms = (time.perf_counter() - start) * 1000 / args.steps
+
+    start = time.perf_counter()
+    for frame in frames[image_num:]:
+        online.step(frame)
+    online_ms = (time.perf_counter() - start) * 1000 / args.steps
+
+    print(f'full window: {full_ms:.1f} ms/decision')
+    print(f'online step: {online_ms:.1f} ms/decision ({full_ms / online_ms:.1f}x)')
@@ -0,0 +1,67 @@
+import argparse
+import json
+import os
+import sys
+sys.path.append('.')
+import tempfile
+import time
+import torch
+from models.light_former import LightFormerPredictor
+from inference.export import export_onnx, export_torchscript
+from inference.onnx_backend import OnnxLightFormer
+
+
+def parse_args() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='compare eager PyTorch, TorchScript and ONNX Runtime inference latency on cpu.')
+    parser.add_argument('-cfg', '--config', type=str, default='', required=True, help='config file')
+    parser.add_argument('-ckpt', '--checkpoint', type=str, default=None, help='checkpoint file, random weights if not given')
+    parser.add_argument('-m', '--model', type=str, default=None, help='exported ONNX file, exported from the checkpoint if not given')
+    parser.add_argument('-b', '--batch_sizes', type=int, nargs='+', default=[1, 4], help='batch sizes to time')
+    parser.add_argument('-n', '--iterations', type=int, default=5, help='timed iterations per batch size')
+    parser.add_argument('-t', '--threads', type=int, default=None, help='cpu threads of every backend')
+    args = parser.parse_args()
+    return args
+
+
+def time_backend(predict, images, iterations):
+    predict(images) # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        outputs = predict(images)
+    return (time.perf_counter() - start) * 1000 / iterations, outputs
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+    image_size = config.get('image_size', [512, 960])
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    if args.checkpoint is None:
+        predictor = LightFormerPredictor(config=config)
+    else:
+        predictor = LightFormerPredictor.load_from_checkpoint(args.checkpoint, config=config, map_location='cpu')
+    predictor.eval()
+
+    example = torch.randint(0, 256, (1, config['image_num'], 3, *image_size), dtype=torch.uint8)
+    if args.model is None:
+        args.model = os.path.join(tempfile.mkdtemp(), 'lightformer.onnx')
+        export_onnx(predictor, args.model, example)
+    traced = export_torchscript(predictor, os.path.join(tempfile.mkdtemp(), 'lightformer.pt'), example)
+    backends = {
+        'eager': predictor.predict_probs,
+        'torchscript': torch.no_grad()(traced),
+        'onnxruntime': OnnxLightFormer(args.model, args.threads).predict_probs,
+    }
+
+    for batch_size in args.batch_sizes:
+        images = torch.randint(0, 256, (batch_size, config['image_num'], 3, *image_size), dtype=torch.uint8)
+        eager_ms, expected = time_backend(backends['eager'], images, args.iterations)
+        print(f'batch {batch_size}: eager {eager_ms:.1f} ms ({eager_ms / batch_size:.1f} ms/window)')
+        for name in ['torchscript', 'onnxruntime']:
+            ms, outputs = time_backend(backends[name], images, args.iterations)
+            diff = max(float((o - e).abs().max()) for o, e in zip(outputs, expected))
+            print(f'batch {batch_size}: {name} {ms:.1f} ms ({ms / batch_size:.1f} ms/window), '
+                  f'{eager_ms / ms:.2f}x eager, max |diff| {diff:.2e}')
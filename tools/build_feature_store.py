@@ -0,0 +1,87 @@
+import argparse
+import copy
+import json
+import sys
+sys.path.append('.')
+import torch
+from torch.utils.data import DataLoader, Dataset
+from dataset.decode import get_decode_backend
+from dataset.feature_store import FeatureStore
+from dataset.frame_store import FrameStore
+from models.light_former import LightFormerPredictor
+from tools.preprocess_frames import referenced_frames
+
+
+def parse_args() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='run the frozen backbone once per unique frame and store its down_conv features for frozen backbone training.')
+    parser.add_argument('-cfg', '--config', type=str, default='', required=True, help='config file')
+    parser.add_argument('-ckpt', '--checkpoint', type=str, default=None, help='checkpoint whose backbone is frozen, the configured backbone weights and a fresh down_conv if not given')
+    parser.add_argument('-out', '--out_dir', type=str, default=None, help='store directory, defaults to data.feature_store of the config')
+    parser.add_argument('-s', '--splits', type=str, nargs='+', default=['training', 'validation', 'test'], help='config sections whose sample_database_folder lists are read')
+    parser.add_argument('-b', '--batch_size', type=int, default=16, help='frames per backbone batch')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='number of decode processes')
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu', help='device the backbone runs on')
+    args = parser.parse_args()
+    return args
+
+
+class FrameDataset(Dataset):
+    """
+    Single frames in the order of `paths`, read from the frame store when the config has one.
+    """
+
+    def __init__(self, paths, decode_backend, image_size, frame_store=None):
+        self.paths = paths
+        self.decode = get_decode_backend(decode_backend)
+        self.image_size = tuple(image_size)
+        self.frame_store = frame_store
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, idx):
+        if self.frame_store is not None:
+            return self.frame_store.window([self.frame_store.row(self.paths[idx])])[0]
+        return self.decode(self.paths[idx], self.image_size)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+
+    out_dir = args.out_dir or config.get('data', {}).get('feature_store')
+    if out_dir is None:
+        print('No output directory given and data.feature_store is not set, exit')
+        exit(1)
+
+    # The predictor must not read the store it is about to write
+    model_config = copy.deepcopy(config)
+    model_config['data'] = dict(model_config.get('data', {}), feature_store=None)
+    if args.checkpoint is None:
+        predictor = LightFormerPredictor(config=model_config)
+    else:
+        predictor = LightFormerPredictor.load_from_checkpoint(args.checkpoint, config=model_config, map_location='cpu')
+    model = predictor.model.eval().to(args.device)
+
+    data = config.get('data', {})
+    frame_store = FrameStore(data['frame_store']) if data.get('frame_store') else None
+    paths = referenced_frames(config, args.splits)
+    image_size = config.get('image_size', [512, 960])
+    loader = DataLoader(FrameDataset(paths, data.get('decode_backend', 'skimage'), image_size, frame_store),
+                        batch_size=args.batch_size, shuffle=False, num_workers=args.workers)
+
+    with torch.no_grad():
+        feature_shape = tuple(model.encode_frames(torch.zeros((1, 3, *image_size), dtype=torch.uint8, device=args.device)).shape[1:])
+
+    def features():
+        with torch.no_grad():
+            for i, frames in enumerate(loader):
+                for feature in model.encode_frames(frames.to(args.device)).half().cpu().numpy():
+                    yield feature
+                print(f'{min((i + 1) * args.batch_size, len(paths))}/{len(paths)} frames', end='\r', flush=True)
+
+    backbone = {k: v.cpu() for k, v in model.state_dict().items() if k.startswith(('backbone.', 'down_conv.'))}
+    print(f'Writing features of {len(paths)} frames, {feature_shape} each, to {out_dir}')
+    FeatureStore.create(out_dir, paths, feature_shape, 'float16', features(), backbone_state_dict=backbone)
+    print('\nDone')
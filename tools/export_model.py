@@ -0,0 +1,48 @@
+import argparse
+import json
+import sys
+sys.path.append('.')
+import torch
+from models.light_former import LightFormerPredictor
+from inference.export import export_onnx, export_torchscript
+
+
+def parse_args() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='export the full LightFormer predictor to ONNX or TorchScript.')
+    parser.add_argument('-cfg', '--config', type=str, default='', required=True, help='config file')
+    parser.add_argument('-ckpt', '--checkpoint', type=str, default=None, help='checkpoint file, random weights if not given')
+    parser.add_argument('-out', '--output', type=str, default='lightformer.onnx', help='output file')
+    parser.add_argument('-f', '--format', type=str, default='onnx', choices=['onnx', 'torchscript'], help='export format')
+    parser.add_argument('--opset', type=int, default=17, help='ONNX opset version, grid_sample needs 16 or later')
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+    image_size = config.get('image_size', [512, 960])
+
+    if args.checkpoint is None:
+        predictor = LightFormerPredictor(config=config)
+    else:
+        predictor = LightFormerPredictor.load_from_checkpoint(args.checkpoint, config=config, map_location='cpu')
+    predictor.eval()
+
+    example = torch.randint(0, 256, (1, config['image_num'], 3, *image_size), dtype=torch.uint8)
+    if args.format == 'onnx':
+        export_onnx(predictor, args.output, example, args.opset)
+        from inference.onnx_backend import OnnxLightFormer
+        exported = OnnxLightFormer(args.output).predict_probs
+    else:
+        exported = export_torchscript(predictor, args.output, example)
+    print(f'Exported {args.format} model to {args.output}')
+
+    # Check the exported model against eager PyTorch on a batch size other than the traced one
+    images = torch.randint(0, 256, (2, config['image_num'], 3, *image_size), dtype=torch.uint8)
+    with torch.no_grad():
+        expected = predictor.predict_probs(images)
+        actual = exported(images)
+    diff = max(float((a - e).abs().max()) for a, e in zip(actual, expected))
+    print(f'max |diff| against eager: {diff:.2e}')
@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+sys.path.append('.')
+import tempfile
+import time
+import numpy as np
+import torch
+from inference.server import latency_summary, read_message, write_message
+
+
+def parse_args() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='offline load generator for the LightFormer inference server, synthetic camera streams.')
+    parser.add_argument('--socket', type=str, default='/tmp/lightformer.sock', help='unix socket of a running server')
+    parser.add_argument('--port', type=int, default=None, help='connect to localhost:port instead of the unix socket')
+    parser.add_argument('-cfg', '--config', type=str, default=None, help='start an in-process server from this config instead of connecting to one')
+    parser.add_argument('-ckpt', '--checkpoint', type=str, default=None, help='checkpoint of the in-process server, random weights if not given')
+    parser.add_argument('--onnx', type=str, default=None, help='exported ONNX model of the in-process server, eager PyTorch if not given')
+    parser.add_argument('--max_batch', type=int, default=8, help='largest micro batch of the in-process server')
+    parser.add_argument('--max_wait_ms', type=float, default=10.0, help='batching deadline of the in-process server')
+    parser.add_argument('-s', '--streams', type=int, default=8, help='number of concurrent camera streams')
+    parser.add_argument('-r', '--requests', type=int, default=10, help='requests per stream')
+    parser.add_argument('--fps', type=float, default=0.0, help='request rate per stream, 0 sends the next request as soon as the last one returns')
+    parser.add_argument('--image_num', type=int, default=10, help='frames per window')
+    parser.add_argument('--image_size', type=int, nargs=2, default=[512, 960], help='frame height and width')
+    parser.add_argument('-t', '--threads', type=int, default=None, help='torch cpu threads of the in-process server')
+    args = parser.parse_args()
+    return args
+
+
+async def camera(stream, connect, windows, requests, fps):
+    """
+    One synthetic camera stream, returns the client side latency of each request.
+    """
+    reader, writer = await connect()
+    latencies = []
+    period = 1.0 / fps if fps > 0 else 0.0
+    for i in range(requests):
+        start = time.perf_counter()
+        window = windows[(stream + i) % len(windows)]
+        write_message(writer, {'op': 'predict', 'stream': stream, 'shape': list(window.shape)}, window.tobytes())
+        await writer.drain()
+        header, _ = await read_message(reader)
+        if 'error' in header:
+            raise RuntimeError(header['error'])
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(max(0.0, period - (time.perf_counter() - start)))
+    writer.close()
+    await writer.wait_closed()
+    return latencies
+
+
+async def server_stats(connect):
+    reader, writer = await connect()
+    write_message(writer, {'op': 'stats'})
+    await writer.drain()
+    header, _ = await read_message(reader)
+    writer.close()
+    await writer.wait_closed()
+    return header
+
+
+async def main(args):
+    if args.config is not None:
+        from tools.serve import build_server
+        with open(args.config, 'r') as f:
+            config = json.load(f)
+        args.image_num = config['image_num']
+        args.image_size = config.get('image_size', [512, 960])
+        server = build_server(config, args.checkpoint, args.max_batch, args.max_wait_ms, args.onnx)
+        args.socket = os.path.join(tempfile.mkdtemp(), 'lightformer.sock')
+        args.port = None
+        listener = await server.start(args.socket)
+
+    if args.port is not None:
+        connect = lambda: asyncio.open_connection('127.0.0.1', args.port)
+    else:
+        connect = lambda: asyncio.open_unix_connection(args.socket)
+
+    # A small pool of random windows, generating one per request would dominate the client
+    rng = np.random.default_rng(0)
+    windows = [rng.integers(0, 256, (args.image_num, 3, *args.image_size), dtype=np.uint8) for _ in range(4)]
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[camera(stream, connect, windows, args.requests, args.fps)
+                                     for stream in range(args.streams)])
+    elapsed = time.perf_counter() - start
+
+    client = latency_summary([latency for latencies in results for latency in latencies])
+    served = await server_stats(connect)
+    print(f"{args.streams} streams x {args.requests} requests in {elapsed:.1f} s, {client['count'] / elapsed:.2f} windows/s")
+    print(f"client latency: p50 {client['p50_ms']:.1f} ms, p99 {client['p99_ms']:.1f} ms, mean {client['mean_ms']:.1f} ms")
+    print(f"server latency: p50 {served['p50_ms']:.1f} ms, p99 {served['p99_ms']:.1f} ms, mean batch {served['mean_batch']:.2f}")
+
+    if args.config is not None:
+        listener.close()
+        await listener.wait_closed()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    asyncio.run(main(args))
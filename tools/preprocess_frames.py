@@ -0,0 +1,54 @@
+import argparse
+import json
+import os
+import sys
+sys.path.append('.')
+from multiprocessing import Pool
+from functools import partial
+from dataset.decode import get_decode_backend
+from dataset.frame_store import FrameStore
+from dataset.sample_index import SampleIndex
+
+
+def parse_args() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='decode and resize every referenced frame once into a memory mapped frame store.')
+    parser.add_argument('-cfg', '--config', type=str, default='', required=True, help='config file')
+    parser.add_argument('-out', '--out_dir', type=str, default=None, help='store directory, defaults to data.frame_store of the config')
+    parser.add_argument('-s', '--splits', type=str, nargs='+', default=['training', 'validation', 'test'], help='config sections whose sample_database_folder lists are read')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help='number of decode processes')
+    args = parser.parse_args()
+    return args
+
+
+def referenced_frames(config, splits):
+    """
+    Every frame path referenced by a sample of the given config sections.
+    """
+    paths = []
+    for split in splits:
+        paths += SampleIndex(config[split]['sample_database_folder']).frame_paths()
+    return FrameStore.sort_paths(paths)
+
+
+def decode_frame(image_path, backend, image_size):
+    return get_decode_backend(backend)(image_path, tuple(image_size)).numpy()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+
+    out_dir = args.out_dir or config.get('data', {}).get('frame_store')
+    if out_dir is None:
+        print('No output directory given and data.frame_store is not set, exit')
+        exit(1)
+
+    backend = config.get('data', {}).get('decode_backend', 'skimage')
+    paths = referenced_frames(config, args.splits)
+    print(f'Writing {len(paths)} frames decoded with {backend} to {out_dir}')
+    with Pool(args.workers) as pool:
+        image_size = config.get('image_size', [512, 960])
+        frames = pool.imap(partial(decode_frame, backend=backend, image_size=image_size), paths, chunksize=8)
+        FrameStore.create(out_dir, paths, (3, *image_size), 'uint8', frames)
+    print('Done')
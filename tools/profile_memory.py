@@ -0,0 +1,80 @@
+import argparse
+import copy
+import json
+import multiprocessing as mp
+import sys
+sys.path.append('.')
+import time
+import torch
+from models.light_former import LightFormerPredictor
+from models.profiler import peak_rss_mb
+
+
+MODES = {
+    'default': {'checkpoint_backbone': False, 'backbone_chunk_size': 0},
+    'checkpoint': {'checkpoint_backbone': True, 'backbone_chunk_size': 0},
+    'chunk': {'checkpoint_backbone': False, 'backbone_chunk_size': None},
+    'checkpoint+chunk': {'checkpoint_backbone': True, 'backbone_chunk_size': None},
+}
+
+
+def parse_args() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='peak RSS and time of one cpu training step against batch size, with and without backbone checkpointing and chunking.')
+    parser.add_argument('-cfg', '--config', type=str, default='', required=True, help='config file')
+    parser.add_argument('-b', '--batch_sizes', type=int, nargs='+', default=[1, 2, 4, 8], help='training batch sizes to profile')
+    parser.add_argument('-m', '--modes', type=str, nargs='+', default=list(MODES), choices=list(MODES), help='memory options to compare')
+    parser.add_argument('-c', '--chunk_size', type=int, default=10, help='frames per backbone pass of the chunk modes, one window by default')
+    parser.add_argument('-t', '--threads', type=int, default=None, help='torch cpu threads')
+    args = parser.parse_args()
+    return args
+
+
+def train_step(config, batch_size, threads, queue):
+    """
+    One forward and backward pass of a random batch, run in a fresh process so its peak RSS
+    is not hidden by an earlier, larger step.
+    """
+    if threads is not None:
+        torch.set_num_threads(threads)
+    predictor = LightFormerPredictor(config=config).train()
+    batch = {
+        'images': torch.randint(0, 256, (batch_size, config['image_num'], 3, *config.get('image_size', [512, 960])), dtype=torch.uint8),
+        'label': torch.tensor([[1., 0., 1., 0.]]).repeat(batch_size, 1),
+    }
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    predictor.cal_loss_step(batch).backward()
+    queue.put((peak_rss_mb(), peak_rss_mb() - before, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+
+    # Weights do not change the memory profile, and the step must not read a feature store
+    config['backbone'] = dict(config.get('backbone', {}), weights=None)
+    config['data'] = dict(config.get('data', {}), feature_store=None)
+
+    context = mp.get_context('spawn')
+    print(f"{config.get('backbone', {}).get('name', 'resnet18')} backbone, {config.get('neck', 'conv')} neck, "
+          f"{config['image_num']} x {config.get('image_size', [512, 960])} frames per window")
+    print(f'| mode | batch | peak RSS (MB) | step RSS (MB) | s / step |')
+    print(f'|---|---|---|---|---|')
+    for mode in args.modes:
+        model_config = copy.deepcopy(config)
+        options = dict(MODES[mode])
+        if options['backbone_chunk_size'] is None:
+            options['backbone_chunk_size'] = args.chunk_size
+        model_config['training'] = dict(model_config['training'], **options)
+        for batch_size in args.batch_sizes:
+            queue = context.Queue()
+            process = context.Process(target=train_step, args=(model_config, batch_size, args.threads, queue))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                # Most likely killed by the kernel out of memory
+                print(f'| {mode} | {batch_size} | failed, exit code {process.exitcode} | | |', flush=True)
+                continue
+            peak, step, seconds = queue.get()
+            print(f'| {mode} | {batch_size} | {peak:.0f} | {step:.0f} | {seconds:.2f} |', flush=True)
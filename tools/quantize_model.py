@@ -0,0 +1,109 @@
+import argparse
+import json
+import os
+import sys
+sys.path.append('.')
+import time
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Subset
+from analysis import direction_precision_recall_f1, print_precision_recall_f1
+from dataset.dataset import LightFormerDataset
+from models.light_former import LightFormerPredictor
+from inference.export import export_torchscript
+from inference.quantize import default_backend, quantize_predictor
+
+
+def parse_args() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='post-training INT8 quantization of LightFormer for cpu inference, with a latency and accuracy report.')
+    parser.add_argument('-cfg', '--config', type=str, default='', required=True, help='config file')
+    parser.add_argument('-ckpt', '--checkpoint', type=str, default=None, help='checkpoint file, random weights if not given')
+    parser.add_argument('-out', '--output', type=str, default='lightformer_int8.pt', help='quantized TorchScript model')
+    parser.add_argument('-r', '--report', type=str, default=None, help='json report, next to the output if not given')
+    parser.add_argument('--backend', type=str, default=None, choices=['x86', 'fbgemm', 'qnnpack'], help='quantized backend, x86 or qnnpack on ARM')
+    parser.add_argument('-c', '--calib_samples', type=int, default=32, help='number of calibration samples')
+    parser.add_argument('--calib_split', type=str, default='training', help='config section the calibration samples are drawn from')
+    parser.add_argument('-e', '--eval_samples', type=int, default=0, help='number of test samples to evaluate, 0 for all')
+    parser.add_argument('-b', '--batch_size', type=int, default=4, help='calibration and evaluation batch size')
+    parser.add_argument('-n', '--iterations', type=int, default=5, help='timed iterations of the latency benchmark')
+    parser.add_argument('-t', '--threads', type=int, default=None, help='torch cpu threads')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the calibration and evaluation subsets')
+    args = parser.parse_args()
+    return args
+
+
+def sample_loader(config, split, num_samples, batch_size, seed):
+    """
+    Loader over num_samples random samples of a config section, all of them when num_samples is 0.
+    """
+    dataset = LightFormerDataset(config[split]['sample_database_folder'],
+                                 decode_backend=config.get('data', {}).get('decode_backend', 'skimage'),
+                                 image_num=config['image_num'], image_size=config.get('image_size', [512, 960]))
+    if 0 < num_samples < len(dataset):
+        indices = np.random.default_rng(seed).choice(len(dataset), num_samples, replace=False)
+        dataset = Subset(dataset, sorted(indices.tolist()))
+    return DataLoader(dataset, batch_size=batch_size, shuffle=False,
+                      num_workers=config[split]['loader_worker_num'])
+
+
+def evaluate(predict, loader):
+    """
+    Per direction precision, recall and F1 of predict over a loader.
+    """
+    columns = []
+    for batch in loader:
+        st_prob, lf_prob = predict(batch['images'])
+        columns.append(torch.stack([st_prob.argmax(dim=1), batch['label'][:, :2].argmax(dim=1),
+                                    lf_prob.argmax(dim=1), batch['label'][:, 2:4].argmax(dim=1)], dim=1))
+    columns = torch.cat(columns).numpy()
+    return direction_precision_recall_f1(columns[:, 0], columns[:, 1], columns[:, 2], columns[:, 3])
+
+
+def latency_ms(predict, images, iterations):
+    predict(images) # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        predict(images)
+    return (time.perf_counter() - start) * 1000 / iterations / len(images)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+    image_size = config.get('image_size', [512, 960])
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    if args.checkpoint is None:
+        predictor = LightFormerPredictor(config=config)
+    else:
+        predictor = LightFormerPredictor.load_from_checkpoint(args.checkpoint, config=config, map_location='cpu')
+    predictor.eval()
+
+    backend = args.backend or default_backend()
+    calibration = sample_loader(config, args.calib_split, args.calib_samples, args.batch_size, args.seed)
+    print(f'Calibrating on {len(calibration.dataset)} {args.calib_split} samples, {backend} backend')
+    quantized = quantize_predictor(predictor, (batch['images'] for batch in calibration), backend, tuple(image_size))
+
+    example = torch.randint(0, 256, (1, config['image_num'], 3, *image_size), dtype=torch.uint8)
+    traced = export_torchscript(quantized, args.output, example)
+    print(f'Saved quantized model to {args.output}')
+
+    models = {'float32': predictor.predict_probs, 'int8': torch.no_grad()(traced)}
+    images = torch.randint(0, 256, (args.batch_size, config['image_num'], 3, *image_size), dtype=torch.uint8)
+    test_loader = sample_loader(config, 'test', args.eval_samples, args.batch_size, args.seed)
+    report = {'backend': backend, 'calib_samples': len(calibration.dataset), 'eval_samples': len(test_loader.dataset)}
+    for name, predict in models.items():
+        report[name] = {
+            'latency_ms_per_window': latency_ms(predict, images, args.iterations),
+            'metrics': evaluate(predict, test_loader),
+        }
+        print(f"{name}: {report[name]['latency_ms_per_window']:.1f} ms/window at batch {args.batch_size}")
+        print_precision_recall_f1(report[name]['metrics'])
+    print(f"int8 speedup: {report['float32']['latency_ms_per_window'] / report['int8']['latency_ms_per_window']:.2f}x")
+
+    report_path = args.report or os.path.splitext(args.output)[0] + '.json'
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Saved report to {report_path}')
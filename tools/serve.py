@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+sys.path.append('.')
+import torch
+from models.light_former import LightFormerPredictor
+from inference.server import InferenceServer
+
+
+def parse_args() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='serve LightFormer to many local camera streams with dynamic batching.')
+    parser.add_argument('-cfg', '--config', type=str, default='', required=True, help='config file')
+    parser.add_argument('-ckpt', '--checkpoint', type=str, default=None, help='checkpoint file, random weights if not given')
+    parser.add_argument('--onnx', type=str, default=None, help='serve this exported ONNX model under ONNX Runtime instead of eager PyTorch')
+    parser.add_argument('--socket', type=str, default='/tmp/lightformer.sock', help='unix socket path')
+    parser.add_argument('--port', type=int, default=None, help='listen on localhost:port instead of the unix socket')
+    parser.add_argument('--max_batch', type=int, default=8, help='largest micro batch')
+    parser.add_argument('--max_wait_ms', type=float, default=10.0, help='latency deadline for filling a micro batch')
+    parser.add_argument('--report_every', type=float, default=10.0, help='seconds between latency reports')
+    parser.add_argument('-t', '--threads', type=int, default=None, help='torch cpu threads')
+    args = parser.parse_args()
+    return args
+
+
+def build_server(config, checkpoint=None, max_batch=8, max_wait_ms=10.0, onnx=None):
+    if onnx is not None:
+        from inference.onnx_backend import OnnxLightFormer
+        predictor = OnnxLightFormer(onnx, torch.get_num_threads())
+    elif checkpoint is None:
+        predictor = LightFormerPredictor(config=config).eval()
+    else:
+        predictor = LightFormerPredictor.load_from_checkpoint(checkpoint, config=config, map_location='cpu').eval()
+    shape = (config['image_num'], 3, *config.get('image_size', [512, 960]))
+    return InferenceServer(predictor.predict_probs, shape, max_batch, max_wait_ms)
+
+
+async def serve(server, socket_path, port, report_every):
+    if port is None and os.path.exists(socket_path):
+        os.remove(socket_path)
+    listener = await server.start(None if port is not None else socket_path, port)
+    print(f'Serving on {socket_path if port is None else f"127.0.0.1:{port}"}', flush=True)
+    report = asyncio.get_running_loop().create_task(server.report(report_every))
+    async with listener:
+        await listener.serve_forever()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    server = build_server(config, args.checkpoint, args.max_batch, args.max_wait_ms, args.onnx)
+    asyncio.run(serve(server, args.socket, args.port, args.report_every))
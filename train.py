@@ -1,11 +1,16 @@
 import argparse
 import os
 import json
+import torch
 import pytorch_lightning as pl
 from pytorch_lightning import seed_everything
 from pytorch_lightning.callbacks import LearningRateMonitor, ModelCheckpoint
 from pytorch_lightning.loggers import TensorBoardLogger
+from pytorch_lightning.profilers import PyTorchProfiler
+from pytorch_lightning.strategies import DDPStrategy
+from torch.nn import SyncBatchNorm
 from models.light_former import LightFormerPredictor
+from models.sync_batchnorm import convert_sync_batchnorm
 
 # import sys
 # sys.path.append('.')
@@ -16,13 +21,15 @@ def parse_args() -> argparse.ArgumentParser:
     parser.add_argument('-ckpt', '--checkpoint', type=str, default=None, help='checkpoint file')
     parser.add_argument('-save', '--save_path', type=str, default='./result', help='path to save model')
     parser.add_argument('-log', '--log_dir', type=str, default='./log', help='log directory')
-    parser.add_argument('-d', '--devices', type=int, default=1, help='0: cpu, n: n num of devices, -1: all devices')
+    parser.add_argument('-d', '--devices', type=int, default=1, help='0: exit, n: n num of devices (processes with the cpu accelerator), -1: all devices')
     parser.add_argument('-n', '--node', type=int, default=1, help='num of nodes across multi machines')
     parser.add_argument('--resume_weight_only',
                         dest='resume_weight_only',
                         action='store_true',
                         default=False, # False
                         help='resume only weights from chekpoint file')
+    parser.add_argument('--profile', action='store_true', default=False, help='log per stage time and memory of the forward pass and write torch.profiler traces to the TensorBoard log')
+    parser.add_argument('--test', action='store_true', default=False, help='evaluate the best checkpoint on the test set after training and print the neck latency and accuracy')
     parser.add_argument('-v', '--verbose', type=bool, default=False, required=False, help='print more console statements for debugging')
     args = parser.parse_args()
     return args
@@ -85,6 +92,19 @@ if __name__ == '__main__':
                                      log_momentum=True,
                                      log_weight_decay=True)
 
+    # Per stage timing (config 'profile') and, with --profile, torch.profiler traces for TensorBoard
+    profiler = None
+    if args.profile:
+        config['profile'] = True
+        profiler = PyTorchProfiler(dirpath=tb_logger.log_dir, filename='profile', profile_memory=True,
+                                   on_trace_ready=torch.profiler.tensorboard_trace_handler(tb_logger.log_dir))
+
+    # Data parallel training over devices x nodes processes, gloo on cpu
+    strategy = 'auto'
+    if devices != 1 or node_num > 1:
+        accelerator = config['training']['accelerator']
+        strategy = DDPStrategy(process_group_backend='gloo' if accelerator == 'cpu' else None)
+
     # formatting
     print()
 
@@ -100,16 +120,17 @@ if __name__ == '__main__':
         devices=devices,
         max_epochs=config['training']['epoch'],
         logger=tb_logger,
+        profiler=profiler,
+        precision=config['training'].get('precision', '32-true'),
+        accumulate_grad_batches=config['training'].get('accumulate_grad_batches', 1),
+        gradient_clip_val=config['optim']['gradient_clip_val'],
         gradient_clip_algorithm=config['optim']['gradient_clip_algorithm'],
         log_every_n_steps=config['log_every_n_steps'],
         val_check_interval=config['validation']['check_interval'],
         limit_val_batches=config['validation']['limit_batches'],
         # ADDITIONAL
-        # num_nodes=node_num,
-        # strategy='ddp',
-        # sync_batchnorm=True,
-
-        # replace_sampler_ddp=True,
+        num_nodes=node_num,
+        strategy=strategy,
         # auto_lr_find=True
     )
 
@@ -120,7 +141,28 @@ if __name__ == '__main__':
         predictor = LightFormerPredictor.load_from_checkpoint(config=config,
                                                               checkpoint_path=checkpoint_file,
                                                               strict=True)
-        trainer.fit(predictor, ckpt_path=checkpoint_file)
     else:
         predictor = LightFormerPredictor(config=config)
+
+    # Batch norm statistics of down_conv over the batches of all processes. torch's SyncBatchNorm
+    # needs GPU input, convert_sync_batchnorm also runs on cpu over gloo
+    if trainer.world_size > 1:
+        if config['training'].get('backbone_chunk_size', 0) > 0 and not config['training'].get('freeze_backbone', False):
+            print('training.backbone_chunk_size is not supported with several processes: '
+                  'the number of synchronized batch norm calls would differ between processes')
+            exit(1)
+        if config['training']['accelerator'] == 'cpu':
+            predictor.model.down_conv = convert_sync_batchnorm(predictor.model.down_conv)
+        else:
+            predictor.model.down_conv = SyncBatchNorm.convert_sync_batchnorm(predictor.model.down_conv)
+
+    if resume_weight_only:
+        trainer.fit(predictor, ckpt_path=checkpoint_file)
+    else:
         trainer.fit(predictor)
+
+    if args.test:
+        metrics = trainer.test(predictor, ckpt_path='best')[0]
+        if trainer.is_global_zero:
+            print(f"neck {config.get('neck', 'conv')}: {metrics['neck/params_m']:.2f}M params, {metrics['neck/ms_per_frame']:.2f} ms/frame, "
+                  f"straight acc {metrics['test/st_acc']*100:.2f}%, left turn acc {metrics['test/lf_acc']*100:.2f}%, overall acc {metrics['test/acc']*100:.2f}%")